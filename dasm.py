@@ -0,0 +1,926 @@
+#
+#   disassembler utilities
+#
+
+import array
+import base64
+import bisect
+import collections
+import contextlib
+import copy
+import getopt
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import pickle
+import re
+import shlex
+import signal
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zipfile
+from multiprocessing import shared_memory
+
+cachesize = 0x40000000
+chunksize = 0x400
+disassembler = None
+labels = None
+disassemblers = {'01': 'MC6801Disassembler', '05': 'MC6805Disassembler', '09': 'MC6809Disassembler', '6502': 'MCS6502Disassembler', '68k': 'MC68000Disassembler', '80': 'Z80Disassembler'}
+instances = collections.OrderedDict()
+breaks = {}
+flags = None
+
+
+def attach(cls, state, blocks):
+    global disassembler, labels
+    disassembler = cls.__new__(cls)
+    vars(disassembler).update(state)
+    for name, (shm, size) in blocks.items():
+        setattr(disassembler, name, shm.buf[:size])
+    disassembler.decoded = [None] * len(disassembler.attrib)
+    labels = disassembler.jumplabel, disassembler.label
+
+
+def render(chunk):
+    begin, stop, listing, replay, decoded = chunk
+    i = begin - offset(disassembler)
+    disassembler.decoded[i:i + len(decoded)] = decoded
+    if replay is not None:
+        disassembler.jumplabel, disassembler.label = labels[0].copy(), labels[1].copy()
+        for addr in replay:
+            disassembler.decode(addr)
+    return ''.join(disassembler.body(listing, begin, stop))
+
+
+def parallel(d, listing, jobs, count):
+    state = {k: v.copy() if k in ('jumplabel', 'label') else v for k, v in vars(d).items() if k not in ('buffer', 'attrib', 'length', 'decoded')}
+    cuts, decodes = d.split(count)
+    location = d.location
+    lo = offset(d)
+    chunks = [(begin, stop, listing, [addr for addr in decodes if addr < begin] if decodes else None, d.decoded[begin - lo:stop - lo]) for begin, stop in zip(cuts, cuts[1:])]
+    blocks = {}
+    try:
+        for name in ('buffer', 'attrib', 'length'):
+            a = getattr(d, name)
+            shm = shared_memory.SharedMemory(create=True, size=max(len(a), 1))
+            blocks[name] = (shm, len(a))
+            shm.buf[:len(a)] = a
+        with multiprocessing.Pool(jobs, attach, (type(d), state, blocks)) as pool:
+            for chunk, text in zip(chunks, pool.imap(render, chunks)):
+                yield chunk[0], chunk[1], text, not decodes
+    finally:
+        for shm, size in blocks.values():
+            shm.close()
+            shm.unlink()
+    d.location = location
+
+
+def lines(d, filename, listing=False, jobs=1):
+    if jobs <= 1:
+        yield from d.lines(filename, listing)
+        return
+    yield from d.header(filename, listing)
+    for begin, stop, text, clean in parallel(d, listing, jobs, jobs * 4):
+        yield text
+    yield from d.footer(listing)
+
+
+def settled(d):
+    if sum(d.length) != d.attrib.count(b'C'[0]):
+        return False
+    if isinstance(d.jumplabel, set):
+        targets = [i - d.start for i in d.jumplabel if d.start <= i < d.end and not i - d.start & 1]
+    else:
+        targets = [i for i in range(d.start, d.end) if d.jumplabel[i]]
+    return all(d.attrib[i] != b'C'[0] or d.length[i] for i in targets)
+
+
+def relabel(d, old, new, entries=()):
+    added = collections.Counter(new) - collections.Counter(old)
+    removed = collections.Counter(old) - collections.Counter(new)
+    if any(line.split(' ')[0] in ('b', 'c', 'd', 'g', 's', 't', 'u', 'v') for line in removed):
+        return False
+    keep = added.copy(); marks = []
+    for line in new:
+        if keep[line]:
+            keep[line] -= 1
+        elif line.split(' ')[0] in ('b', 'g', 's', 't', 'u', 'v'):
+            marks += [line]
+    if marks != [line for line in old if line.split(' ')[0] in ('b', 'g', 's', 't', 'u', 'v')]:
+        return False
+    entry = any(line.split(' ')[0] in ('c', 't') for line in added)
+    if entry and not entries and not any(line.split(' ')[0] in ('c', 't') for line in old):
+        return False
+    attrib = bytes(d.attrib)
+    d.remark = {}
+    d.parse([line for line in added.elements() if line.split(' ')[0] != 'r'] + [line for line in new if line.split(' ')[0] == 'r'])
+    changed = int.from_bytes(attrib, 'little') ^ int.from_bytes(d.attrib, 'little')
+    if changed & int.from_bytes(attrib.translate(bytes([0]) + bytes([0xff]) * 0xff), 'little'):
+        return False
+    if entry:
+        d.trace()
+        return settled(d)
+    return True
+
+
+def offset(d):
+    return d.start if isinstance(d.jumplabel, set) else 0
+
+
+def span(attrib, i, j, c):
+    if c not in breaks:
+        breaks[c] = re.compile(b'[^\\x%02x]' % c)
+    m = breaks[c].search(attrib, i, j)
+    return m.start() if m else j
+
+
+def marked(label, i, j):
+    if isinstance(label, set):
+        return next((k for k in range(i, j) if k in label), j)
+    try:
+        return label.index(True, i, j)
+    except ValueError:
+        return j
+
+
+def stretch(attrib, label, i, j, c, lo=0):
+    w = 0x40
+    while i < j:
+        k = min(i + w, j)
+        stop = marked(label, i, span(attrib, i - lo, k - lo, c) + lo)
+        if stop < k:
+            return stop
+        i, w = k, w * 2
+    return j
+
+
+def width(d):
+    return 6 if isinstance(d.jumplabel, set) else 4
+
+
+class Xref:
+    kinds = {'C': 'call', 'J': 'jump', 'R': 'read', 'P': 'pointer'}
+
+    def __init__(self, d):
+        refs = sorted(set(zip(d.xref[0::3], d.xref[1::3], d.xref[2::3])))
+        self.target = array.array('i', [t for t, s, k in refs])
+        self.source = array.array('i', [s for t, s, k in refs])
+        self.kind = array.array('B', [k for t, s, k in refs])
+        self.width = width(d)
+
+    def __len__(self):
+        return len(self.target)
+
+    def __iter__(self):
+        return ((t, s, chr(k)) for t, s, k in zip(self.target, self.source, self.kind))
+
+    def refs(self, target):
+        i, j = bisect.bisect_left(self.target, target), bisect.bisect_right(self.target, target)
+        return [(self.source[k], chr(self.kind[k])) for k in range(i, j)]
+
+    def remarks(self, remark, count=8):
+        remark = {k: v.copy() for k, v in remark.items()}
+        for target, refs in itertools.groupby(self, lambda x: x[0]):
+            refs = [f'{self.kinds[k]} {s:0{self.width}x}' for t, s, k in refs]
+            for i in range(0, len(refs), count):
+                remark.setdefault(target, []).append('xref: ' + ', '.join(refs[i:i + count]))
+        return remark
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f'{t:0{self.width}x} {self.kinds[k]} {s:0{self.width}x}\n' for t, s, k in self)
+
+
+#   analysis map (-d), little endian, all offsets from the top of the file:
+#     0  8s   magic b'DASMMAP\0'
+#     8  H    version (1)
+#    10  H    header size (64)
+#    12  8s   cpu ('01', '05', '09', '6502', '68k', '80'), NUL padded
+#    20  I    start address
+#    24  I    byte count n
+#    28  I    reserved (0)
+#    32  Q    offset of attrib[n]: b'C', b'S', b'B', b'P', b'G' (not in the image) or 0 (unknown)
+#    40  Q    offset of length[n]: instruction length at each instruction start, otherwise 0
+#    48  Q    offset of marks[n]: bit 0 jumplabel, bit 1 label
+#    56  8x   reserved
+#   arrays are uint8, 64 byte aligned, e.g. numpy.frombuffer(mm, numpy.uint8, n, offset)
+
+mapversion = 1
+
+
+def export(d, path):
+    lo, m, remarks = index(d)
+    i, j = d.start - lo, d.end - lo
+    n = j - i; pad = -n & 63
+    cpu = {v: k for k, v in disassemblers.items()}.get(type(d).__name__, '').encode()
+    temp = f'{path}.{os.getpid()}'
+    try:
+        with open(temp, 'wb') as f:
+            f.write(struct.pack('<8sHH8sIII3Q8x', b'DASMMAP\0', mapversion, 64, cpu, d.start, n, 0, 64, 64 + n + pad, 64 + (n + pad) * 2))
+            for plane in (d.attrib, d.length, m):
+                f.write(plane[i:j]); f.write(bytes(pad))
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def extras(d, comments=False, xrefs=None, mapfile=None):
+    if mapfile:
+        export(d, mapfile)
+    if comments or xrefs:
+        xref = Xref(d)
+        if xrefs:
+            xref.dump(xrefs)
+        if comments:
+            d.remark = xref.remarks(d.remark)
+
+
+def index(d):
+    lo = offset(d)
+    m = bytearray(len(d.attrib))
+    for bit, table in ((1, d.jumplabel), (2, d.label)):
+        for i in table if isinstance(table, set) else [i for i, x in enumerate(table) if x]:
+            if 0 <= i - lo < len(m):
+                m[i - lo] |= bit
+    return lo, m, sorted(d.remark)
+
+
+def fingerprint(d, index, begin, stop, listing):
+    lo, m, remarks = index
+    i, j = begin - lo, stop + 1 - lo
+    notes = [(addr, d.remark[addr]) for addr in remarks[bisect.bisect_left(remarks, begin):bisect.bisect_right(remarks, stop)]]
+    return digest(begin, stop, listing, d.attrib[i:j], d.length[i:j], m[i:j], notes)
+
+
+def patch(d, filename, listing, jobs, old, new):
+    yield from d.header(filename, listing)
+    count = max((d.end - d.start) // chunksize, 1)
+    labels = index(d)
+    if jobs > 1 and not old:
+        for n, (begin, stop, text, clean) in enumerate(parallel(d, listing, jobs, count), 1):
+            if clean:
+                new[begin] = (n, stop, fingerprint(d, labels, begin, stop, listing), text)
+            yield text
+        yield from d.footer(listing)
+        return
+    location = d.start; n = 1
+    while location < d.end:
+        begin = location
+        chunk = old.get(begin)
+        if chunk and chunk[0] == n and chunk[2] == fingerprint(d, labels, begin, chunk[1], listing):
+            new[begin] = chunk; location = chunk[1]
+        else:
+            d.flags = None
+            text = ''.join(d.body(listing, begin, max(d.start + (d.end - d.start) * n // count, begin + 1)))
+            location = d.location
+            if d.flags is None:
+                chunk = new[begin] = (n, location, fingerprint(d, labels, begin, location, listing), text)
+            else:
+                chunk = (n, location, None, text); labels = index(d)
+        n += 1
+        yield chunk[3]
+    d.location = location
+    yield from d.footer(listing)
+
+
+def member(path):
+    if not os.path.exists(path):
+        archive, sep, name = path.rpartition(':')
+        if sep and os.path.isfile(archive):
+            return archive, name
+    return path, None
+
+
+def read(path, size=-1, mapping=False):
+    archive, name = member(path)
+    if name is not None:
+        with zipfile.ZipFile(archive) as z, z.open(name) as f:
+            return f.read(size)
+    opener = {'.gz': gzip.open, '.xz': lzma.open}.get(os.path.splitext(path)[1].lower())
+    if opener:
+        with opener(path, 'rb') as f:
+            return f.read(size)
+    with open(path, 'rb') as f:
+        if mapping and os.fstat(f.fileno()).st_size:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read(size)
+
+
+def hexfile(path):
+    name = path[:-3] if path.lower().endswith(('.gz', '.xz')) else path
+    return os.path.splitext(name)[1].lower() in ('.hex', '.ihx', '.mot', '.s19', '.s28', '.s37', '.srec')
+
+
+def segments(path):
+    chunks = []; base = 0
+    for n, line in enumerate(read(path).decode('ascii').splitlines(), 1):
+        line = line.strip()
+        if line.startswith(':'):
+            rec = bytes.fromhex(line[1:])
+            if len(rec) < 5 or len(rec) != rec[0] + 5 or sum(rec) & 0xff:
+                raise ValueError(f'{path}:{n}: 不正なレコードです')
+            if rec[3] == 0:
+                chunks += [(base + (rec[1] << 8 | rec[2]), rec[4:-1])]
+            elif rec[3] == 1:
+                break
+            elif rec[3] == 2:
+                base = (rec[4] << 8 | rec[5]) << 4
+            elif rec[3] == 4:
+                base = (rec[4] << 8 | rec[5]) << 16
+        elif line.startswith('S') and line[1:2] in ('1', '2', '3'):
+            rec = bytes.fromhex(line[2:]); size = int(line[1]) + 1
+            if len(rec) < size + 2 or len(rec) != rec[0] + 1 or sum(rec) & 0xff != 0xff:
+                raise ValueError(f'{path}:{n}: 不正なレコードです')
+            chunks += [(int.from_bytes(rec[1:1 + size], 'big'), rec[1 + size:-1])]
+    chunks = [(addr, data) for addr, data in chunks if data]
+    if not chunks:
+        return b'', 0, []
+    start = min(addr for addr, data in chunks); end = max(addr + len(data) for addr, data in chunks)
+    image = bytearray(end - start); covered = bytearray(end - start)
+    for addr, data in chunks:
+        image[addr - start:addr - start + len(data)] = data
+        covered[addr - start:addr - start + len(data)] = b'\1' * len(data)
+    return image, start, [f'g {start + m.start():x} {m.end() - m.start()}\n' for m in re.finditer(rb'\0+', covered)]
+
+
+def address(a):
+    if ':' in a:
+        number, addr = a.split(':')
+        return int(number), int(addr, 0)
+    return int(a, 0)
+
+
+def bank(labels, n=None, common=True):
+    result = []
+    for line in labels:
+        words = line.split(' ')
+        if len(words) > 1 and ':' in words[1]:
+            number, addr = words[1].split(':')
+            if n is None or int(number) != n:
+                continue
+            line = ' '.join([words[0], addr] + words[2:])
+        elif not common:
+            continue
+        result += [line]
+    return result
+
+
+def prefixed(labels):
+    return [n for n, line in enumerate(labels, 1) if len(line.split(' ')) > 1 and ':' in line.split(' ')[1]]
+
+
+def digest(*items):
+    h = hashlib.sha256()
+    for item in items:
+        data = item if isinstance(item, (bytes, bytearray, mmap.mmap)) else repr(item).encode()
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def load(cache, name):
+    path = os.path.join(cache, name)
+    try:
+        with open(path, 'rb') as f:
+            check = f.read(32); data = f.read()
+        if hashlib.sha256(data).digest() == check:
+            os.utime(path)
+            return data
+        os.remove(path)
+    except OSError:
+        pass
+    return None
+
+
+def save(cache, name, chunks):
+    path = os.path.join(cache, name)
+    temp = f'{path}.{os.getpid()}'
+    h = hashlib.sha256()
+    try:
+        os.makedirs(cache, exist_ok=True)
+        f = open(temp, 'wb')
+        f.write(bytes(32))
+    except OSError:
+        f = None
+    try:
+        for s in chunks:
+            if f:
+                data = s.encode() if isinstance(s, str) else s
+                h.update(data)
+                try:
+                    f.write(data)
+                except OSError:
+                    f.close(); f = None
+            yield s
+        if f:
+            try:
+                f.seek(0)
+                f.write(h.digest())
+                f.close()
+                os.replace(temp, path)
+            except OSError:
+                pass
+            evict(cache)
+    finally:
+        if f:
+            f.close()
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+def evict(cache):
+    try:
+        entries = sorted([(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(cache) if e.name.endswith(('.side', '.state', '.text'))])
+        total = sum([size for mtime, size, path in entries])
+        for mtime, size, path in entries:
+            if total <= cachesize:
+                break
+            os.remove(path)
+            total -= size
+    except OSError:
+        pass
+
+
+def restore(cls, data, image):
+    d = cls.__new__(cls)
+    vars(d).update(pickle.loads(data))
+    if 'buffer' not in vars(d):
+        d.buffer = image
+    return d
+
+
+def output(cls, filename, image, start=0, entries=(), labels=(), force=False, listing=False, jobs=1, cache=None, comments=False, xrefs=None, mapfile=None):
+    if multiprocessing.current_process().daemon:
+        jobs = 1
+    if not cache:
+        d = cls(image, start, entries, labels, force)
+        extras(d, comments, xrefs, mapfile)
+        yield from lines(d, filename, listing, jobs)
+        return
+    with open(sys.modules[cls.__module__].__file__, 'rb') as f, open(__file__, 'rb') as g:
+        base = digest(cls.__name__, f.read(), g.read(), image, start, entries, force)
+    key = digest(base, labels)
+    name = f'{digest(key, filename, listing, comments)}.text'
+    text = load(cache, name) if not xrefs and not mapfile else None
+    if text is not None:
+        yield text.decode()
+        return
+    side = load(cache, f'{base}.side')
+    table, state, chunks = pickle.loads(side) if side is not None else ((), None, {})
+    data = load(cache, f'{key}.state')
+    if data is not None:
+        d = restore(cls, data, image)
+    else:
+        if state is not None:
+            d = restore(cls, state, image)
+        if state is None or not relabel(d, table, labels, entries):
+            d = cls(image, start, entries, labels, force)
+        data = pickle.dumps({k: v for k, v in vars(d).items() if v is not image}, pickle.HIGHEST_PROTOCOL)
+        list(save(cache, f'{key}.state', [data]))
+    extras(d, comments, xrefs, mapfile)
+    new = {}
+    yield from save(cache, name, patch(d, filename, listing, jobs, chunks, new))
+    list(save(cache, f'{base}.side', [pickle.dumps((list(labels), data, new), pickle.HIGHEST_PROTOCOL)]))
+
+
+def banked(cls, filename, image, start, window, size, fixed=0, entries=(), labels=(), force=False, listing=False, jobs=1, cache=None, comments=False, xrefs=None, mapfile=None):
+    def collect(d, begin, end):
+        jumps, names = [], []
+        for ea in range(begin, end):
+            if d.jumplabel[ea] and d.attrib[ea] == b'C'[0] and d.length[ea]:
+                jumps += [ea]
+            elif d.jumplabel[ea] or d.label[ea]:
+                names += [ea]
+        return jumps, names
+
+    def marks(names):
+        return [f'd {ea:x}\n' for ea in sorted(names)]
+
+    head = image[fixed:fixed + (window if window > start else 0x10000) - start]
+    rest = image[:fixed] + image[fixed + len(head):]
+    banks = [rest[i:i + size] for i in range(0, len(rest), size)]
+    lo, hi = min(start, window), max(start + len(head), window + size)
+    gaps = [f'g {a:x} {b - a}\n' for a, b in ((start + len(head), window), (window + size, start)) if a < b]
+    common = [ea for ea in entries if not isinstance(ea, tuple)]
+    if not common and not any(line.split(' ')[0] in ('c', 't') for line in bank(labels)):
+        common = [start]
+    jumps, names = set(), set(); found = []
+    for n, data in enumerate(banks):
+        buffer = bytearray(hi - lo)
+        buffer[start - lo:start - lo + len(head)] = head
+        buffer[window - lo:window - lo + len(data)] = data
+        d = cls(buffer, lo, common + [ea[1] for ea in entries if isinstance(ea, tuple) and ea[0] == n], gaps + bank(labels, n), force)
+        a, b = collect(d, start, start + len(head))
+        jumps.update(a); names.update(b)
+        found += [collect(d, window, window + len(data))]
+    yield from output(cls, f'{filename} (fixed)', head, start, common + sorted(jumps), bank(labels) + marks(names - jumps), force, listing, jobs, cache, comments, xrefs and f'{xrefs}.fixed', mapfile and f'{mapfile}.fixed')
+    for n, (data, (a, b)) in enumerate(zip(banks, found)):
+        yield from output(cls, f'{filename} (bank {n})', data, window, a, bank(labels, n) + marks(b), force, listing, jobs, cache, comments, xrefs and f'{xrefs}.{n}', mapfile and f'{mapfile}.{n}')
+
+
+@contextlib.contextmanager
+def create(path, bufsize=0x100000):
+    if not path:
+        yield sys.stdout
+        return
+    temp = f'{path}.{os.getpid()}'
+    try:
+        with open(temp, 'w', encoding='utf-8', buffering=bufsize) as f:
+            yield f
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def stamp(paths):
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps += [(st.st_mtime_ns, st.st_size)]
+        except OSError:
+            stamps += [None]
+    return stamps
+
+
+def watch(cls, filename, table, output, start=0, entries=(), force=False, listing=False, jobs=1, bufsize=0x100000, comments=False, xrefs=None, mapfile=None, load=None, sources=(), interval=0.2):
+    if not output:
+        print(f'{os.path.basename(sys.argv[0])}: --watch には -o が必要です', file=sys.stderr)
+        sys.exit(2)
+    paths = [member(path)[0] for path in sources or [filename]] + ([table] if table else [])
+    stamps = None; image = None; origin = None; labels = (); d = None; chunks = {}
+    try:
+        while True:
+            current = stamp(paths)
+            if current == stamps:
+                time.sleep(interval)
+                continue
+            time.sleep(interval)
+            if stamp(paths) != current:
+                continue
+            stamps = current
+            try:
+                t0 = time.perf_counter()
+                data, begin, new = load() if load else (read(filename), start, [])
+                new = list(new)
+                if table:
+                    with open(table, 'r', encoding='utf-8') as f:
+                        new += f.readlines()
+                if data != image or begin != origin:
+                    d = None; chunks = {}
+                if d is None or not relabel(d, labels, new, entries):
+                    d = cls(data, begin, entries, new, force)
+                image, origin, labels = data, begin, new
+                t1 = time.perf_counter()
+                jumplabel, label, remark = d.jumplabel.copy(), d.label.copy(), d.remark
+                extras(d, comments, xrefs, mapfile)
+                rendered = {}
+                with create(output, bufsize) as f:
+                    f.writelines(patch(d, filename, listing, jobs, chunks, rendered))
+                d.jumplabel, d.label, d.remark = jumplabel, label, remark
+                chunks = rendered
+                t2 = time.perf_counter()
+                print(f'{time.strftime("%H:%M:%S")} {output}: 解析 {t1 - t0:.3f}秒, 出力 {t2 - t1:.3f}秒', file=sys.stderr)
+            except Exception as e:
+                d = None
+                print(f'{time.strftime("%H:%M:%S")} {output}: {type(e).__name__}: {e}', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+
+
+def job(entry):
+    n, words = entry
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(stderr):
+            importlib.import_module(f'dasm{words[0]}').main(words[1:])
+    except SystemExit as e:
+        if not e.code:
+            return n, 'no input file'
+        return n, stderr.getvalue().strip() or f'exit status {e.code}'
+    except Exception as e:
+        return n, f'{type(e).__name__}: {e}'
+    sys.stderr.write(stderr.getvalue())
+    return n, None
+
+
+def named(words):
+    try:
+        opts, args = getopt.getopt(words[1:], importlib.import_module(f'dasm{words[0]}').options, ['watch'])
+    except (ImportError, getopt.GetoptError):
+        return True
+    return any(o == '-o' for o, a in opts)
+
+
+class Window:
+    def __init__(self, d, pagesize=0x100, pages=256):
+        self.pagesize = pagesize
+        self.limit = pages
+        self.reset(d)
+
+    def reset(self, d):
+        self.d = d
+        self.lo = offset(d)
+        self.pages = collections.OrderedDict()
+        self.shadow = copy.copy(d)
+        self.shadow.jumplabel = set() if isinstance(d.jumplabel, set) else [False] * len(d.jumplabel)
+        self.shadow.label = set() if isinstance(d.label, set) else [False] * len(d.label)
+        self.shadow.pending = []
+        self.refs = None
+
+    def xref(self):
+        if self.refs is None:
+            self.refs = Xref(self.d)
+        return self.refs
+
+    def instruction(self, addr):
+        page = self.pages.get(addr // self.pagesize)
+        if page is None:
+            page = self.pages[addr // self.pagesize] = {}
+            while len(self.pages) > self.limit:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(addr // self.pagesize)
+        if addr not in page:
+            i = addr - self.lo
+            if self.d.attrib[i] == b'C'[0] and self.d.length[i]:
+                s, size = self.d.decoded[i], self.d.length[i]
+            else:
+                s = self.shadow.decode(addr); size = self.shadow.location - addr
+            page[addr] = bytes(self.d.buffer[i:i + size]).ljust(size, b'\0'), s
+        return page[addr]
+
+    def decode(self, addr, count=1):
+        result = []
+        while len(result) < count and self.d.start <= addr < self.d.end:
+            data, s = self.instruction(addr)
+            result += [(addr, data, s)]
+            addr += len(data)
+        return result
+
+    def previous(self, addr):
+        align = self.d.align
+        for base in range(addr - align, max(addr - 16, self.d.start) - 1, -align):
+            if self.d.length[base - self.lo]:
+                if base + self.d.length[base - self.lo] == addr:
+                    return base
+                break
+        for base in range(addr - align, max(addr - 16, self.d.start) - 1, -align):
+            data, s = self.instruction(base)
+            if s and len(data) == addr - base:
+                return base
+        return max(addr - align, self.d.start)
+
+
+def window(cls, image, start=0, entries=None, labels=(), force=False):
+    if entries is None:
+        return instance(cls, image, start, (), [f'b {start:x} {len(image)}'])
+    return instance(cls, image, start, entries, labels, force)
+
+
+def prepare(shared):
+    global flags
+    flags = shared
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for cpu in disassemblers:
+        importlib.import_module(f'dasm{cpu}')
+
+
+def instance(cls, image, start=0, entries=(), labels=(), force=False):
+    key = digest(cls.__name__, image, start, entries, labels, force)
+    if key in instances:
+        instances.move_to_end(key)
+        return instances[key]
+    w = instances[key] = Window(cls(image, start, entries, labels, force))
+    while len(instances) > 8:
+        instances.popitem(last=False)
+    return w
+
+
+class Cancelled(Exception):
+    pass
+
+
+def expired(slot, deadline):
+    return flags[slot] or deadline is not None and time.time() > deadline
+
+
+def poll(slot, deadline):
+    def check(signum, frame):
+        if expired(slot, deadline):
+            raise Cancelled
+    signal.signal(signal.SIGALRM, check)
+    signal.setitimer(signal.ITIMER_REAL, 0.05, 0.05)
+
+
+def run(request, slot, deadline):
+    if hasattr(signal, 'setitimer'):
+        poll(slot, deadline)
+    try:
+        op = request.get('op', 'disassemble')
+        cpu = str(request['cpu'])
+        if cpu not in disassemblers:
+            return {'error': f'unknown cpu: {cpu}'}
+        cls = getattr(importlib.import_module(f'dasm{cpu}'), disassemblers[cpu])
+        if 'path' in request:
+            image = read(request['path'])
+        else:
+            image = base64.b64decode(request['image'])
+        start = int(request.get('start', 0))
+        entries = tuple(request.get('entries', ())); labels = tuple(request.get('labels', ())); force = bool(request.get('force', False))
+        if op in ('decode', 'previous'):
+            w = window(cls, image, start, entries if request.get('trace') else None, labels, force)
+            if op == 'previous':
+                return {'address': w.previous(int(request['address']))}
+            addr = int(request['address']); count = int(request.get('count', 1)); result = []
+            while len(result) < count:
+                if expired(slot, deadline):
+                    return {'error': 'cancelled'}
+                part = w.decode(addr, min(count - len(result), 0x100))
+                if not part:
+                    break
+                result += [[base, data.hex(), s] for base, data, s in part]
+                addr = part[-1][0] + len(part[-1][1])
+            return {'instructions': result}
+        if op not in ('disassemble', 'xref'):
+            return {'error': f'unknown op: {op}'}
+        w = instance(cls, image, start, entries, labels, force); d = w.d
+        if op == 'xref':
+            if 'address' in request:
+                return {'xref': [[int(request['address']), s, Xref.kinds[k]] for s, k in w.xref().refs(int(request['address']))]}
+            return {'xref': [[t, s, Xref.kinds[k]] for t, s, k in w.xref()]}
+        listing = bool(request.get('listing', False))
+        if 'begin' in request or 'stop' in request:
+            lines = d.body(listing, request.get('begin'), request.get('stop'))
+        else:
+            lines = d.lines(request.get('filename', ''), listing)
+        jumplabel, label, remark = d.jumplabel.copy(), d.label.copy(), d.remark
+        if request.get('comments'):
+            d.remark = w.xref().remarks(remark)
+        text = []
+        try:
+            for s in lines:
+                if len(text) & 0x3ff == 0 and expired(slot, deadline):
+                    return {'error': 'cancelled'}
+                text += [s]
+        finally:
+            d.jumplabel, d.label, d.remark = jumplabel, label, remark
+        return {'text': ''.join(text)}
+    except Cancelled:
+        return {'error': 'cancelled'}
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    finally:
+        if hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                key = json.dumps(request.get('id'))
+            except (ValueError, AttributeError) as e:
+                self.reply({'id': None, 'error': f'{type(e).__name__}: {e}'})
+                continue
+            if request.get('op') == 'cancel':
+                if key in self.running:
+                    self.server.flags[self.running[key]] = 1
+                continue
+            with self.server.lock:
+                slot = self.server.free.pop() if self.server.free else None
+            if slot is None:
+                self.reply({'id': request.get('id'), 'error': 'busy'})
+                continue
+            self.server.flags[slot] = 0
+            timeout = request.get('timeout')
+            deadline = time.time() + timeout if timeout else None
+            self.running[key] = slot
+            result = self.server.pool.apply_async(run, (request, slot, deadline))
+            threading.Thread(target=self.wait, args=(request.get('id'), key, slot, result, timeout), daemon=True).start()
+        for slot in list(self.running.values()):
+            self.server.flags[slot] = 1
+
+    def wait(self, id, key, slot, result, timeout):
+        result.wait(timeout)
+        if result.ready():
+            response = result.get()
+        else:
+            self.server.flags[slot] = 1
+            response = {'error': 'timeout'}
+        self.running.pop(key, None)
+        self.reply({'id': id, **response})
+        result.wait()
+        with self.server.lock:
+            self.server.free += [slot]
+
+    def reply(self, response):
+        with self.lock:
+            try:
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b'\n')
+                self.wfile.flush()
+            except OSError:
+                pass
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(path=None, port=None, jobs=1):
+    signal.signal(signal.SIGTERM, stop)
+    shared = multiprocessing.RawArray('b', 256)
+    with multiprocessing.Pool(jobs, prepare, (shared,)) as pool:
+        if path:
+            if os.path.exists(path):
+                os.remove(path)
+            server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        else:
+            server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+        server.daemon_threads = True
+        server.pool = pool; server.flags = shared; server.free = list(range(len(shared))); server.lock = threading.Lock()
+        try:
+            with server:
+                server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def main(argv=None):
+    opts, args = getopt.getopt(sys.argv[1:] if argv is None else argv, "j:p:u:")
+    jobs = os.cpu_count()
+    path = None
+    port = None
+    for o, a in opts:
+        if o == '-j':
+            jobs = int(a, 0)
+        elif o == '-p':
+            port = int(a, 0)
+        elif o == '-u':
+            path = a
+    if path or port:
+        serve(path, port, jobs)
+        return
+    if len(args) == 0:
+        print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] マニフェスト')
+        print(f'        {os.path.basename(sys.argv[0])} [オプション] -u <パス> | -p <ポート>')
+        print(f'オプション:')
+        print(f'  -j <プロセス数> 同時に実行するジョブ数を指定する(デフォルト:CPU数)')
+        print(f'  -p <ポート>     localhostのTCPポートで逆アセンブルサービスを起動する')
+        print(f'  -u <パス>       Unixドメインソケットで逆アセンブルサービスを起動する')
+        print(f'マニフェスト:')
+        print(f'  1行に1ジョブを「CPU [オプション] ファイル名」の形式で記述する(-oは必須)')
+        print(f'  CPU: 01, 05, 09, 6502, 68k, 80')
+        print(f'サービス:')
+        print(f'  1行に1リクエストをJSONで送ると、同じidを付けた応答が1行のJSONで返る')
+        print(f'  op: disassemble (cpu, image|path, start, entries, labels, force, listing, filename, begin, stop, comments)')
+        print(f'      decode (cpu, image|path, start, address, count, trace, entries, labels, force)')
+        print(f'      previous (cpu, image|path, start, address, trace, entries, labels, force)')
+        print(f'      xref (cpu, image|path, start, entries, labels, force, address)')
+        print(f'      cancel (id)')
+        print(f'  timeout: 秒数を超えたリクエストを打ち切る')
+        sys.exit(0)
+    with open(args[0], 'r', encoding='utf-8') as f:
+        manifest = [(n, words) for n, words in ((n, shlex.split(line, comments=True)) for n, line in enumerate(f, 1)) if words]
+    for cpu in {words[0] for n, words in manifest}:
+        try:
+            importlib.import_module(f'dasm{cpu}')
+        except ImportError:
+            pass
+    failed = 0
+    for n, words in manifest:
+        if not named(words):
+            print(f'{args[0]}:{n}: -o が指定されていません', file=sys.stderr)
+            failed += 1
+    with multiprocessing.Pool(jobs) as pool:
+        for n, error in pool.imap_unordered(job, [(n, words) for n, words in manifest if named(words)]):
+            if error:
+                print(f'{args[0]}:{n}: {error}', file=sys.stderr)
+                failed += 1
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,16 +2,14 @@
 #   MC6809 disassembler
 #
 
-import functools
+import array
+import dasm
 import getopt
+import heapq
 import os
 import sys
 
-buffer = bytearray(0x10000)
-jumplabel = [False] * len(buffer)
-label = [False] * len(buffer)
-location = 0
-flags = ''
+illegal = ('', '', '')
 
 
 def s5(x):
@@ -22,53 +20,46 @@ def s8(x):
     return x & 0x7f | -(x & 0x80)
 
 
-def fetch():
-    global buffer, location
-    c = buffer[location]
-    location += 1
-    return c
+def compile_table(table, size=0x100):
+    return [(t[1], t[2].lower().replace('%s', '{}'), t[3:]) for t in (table.get(i, illegal) for i in range(size))]
 
 
-def fetch16():
-    return fetch() << 8 | fetch()
+def byte(self):
+    return f'${self.fetch():02x}'
 
 
-def byte():
-    return f'${fetch():02x}'
-
-
-def word():
-    global jumplabel, label, flags
-    operand = fetch16()
-    if 'B' in flags:
-        jumplabel[operand] = True
+def word(self):
+    operand = self.fetch16()
+    if 'B' in self.flags:
+        self.jump(operand)
     else:
-        label[operand] = True
+        self.label[operand] = True
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
-def am_relative():
-    global jumplabel, label, location, flags
-    operand = s8(fetch()) + location & 0xffff
-    if 'B' in flags:
-        jumplabel[operand] = True
+def am_relative(self):
+    operand = s8(self.fetch()) + self.location & 0xffff
+    if 'B' in self.flags:
+        self.jump(operand)
     else:
-        label[operand] = True
+        self.label[operand] = True
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
-def am_lrelative():
-    global jumplabel, label, location, flags
-    operand = fetch16() + location & 0xffff
-    if 'B' in flags:
-        jumplabel[operand] = True
+def am_lrelative(self):
+    operand = self.fetch16() + self.location & 0xffff
+    if 'B' in self.flags:
+        self.jump(operand)
     else:
-        label[operand] = True
+        self.label[operand] = True
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
-def am_index():
-    post = fetch(); pl = post & 15
+def am_index(self):
+    post = self.fetch(); pl = post & 15
     if post & 0x80 and post & 0x1f in (0x07, 0x0a, 0x0e, 0x0f, 0x10, 0x12, 0x17, 0x1a, 0x1e):
         return ''
     if not post & 0x80:
@@ -78,15 +69,15 @@ def am_index():
     elif pl == 6:
         offset = 'a'
     elif pl == 8:
-        d = s8(fetch()); offset = f'-${-d:02x}' if d < 0 else f'${d:02x}'
+        d = s8(self.fetch()); offset = f'-${-d:02x}' if d < 0 else f'${d:02x}'
     elif pl == 9 or pl == 15:
-        offset = word()
+        offset = word(self)
     elif pl == 11:
         offset = 'd'
     elif pl == 12:
-        offset = am_relative()
+        offset = am_relative(self)
     elif pl == 13:
-        offset = am_lrelative()
+        offset = am_lrelative(self)
     else:
         offset = ''
     dec = ('-', '--')[post & 1] if (post & 0x8e) == 0x82 else ''
@@ -95,15 +86,14 @@ def am_index():
     return f'{offset},{dec}{reg}{inc}' if not post & 0x80 or not post & 0x10 else f'[{offset},{dec}{reg}{inc}]' if pl != 0x0f else f'[{offset}]'
 
 
-def exg_tfr():
-    post = fetch()
+def exg_tfr(self):
+    post = self.fetch()
     regs = {0:'d', 1:'x', 2:'y', 3:'u', 4:'s', 5:'pc', 8:'a', 9:'b', 0xa:'cc', 0xb:'dp'}
     return f'{regs[post >> 4]},{regs[post & 15]}' if post >> 4 in regs and post & 15 in regs else ''
 
 
-def psh_pul():
-    global buffer, location
-    post = fetch(); regs = ('cc', 'a', 'b', 'dp', 'x', 'y', 's' if buffer[location - 2] & 2 else 'u', 'pc')
+def psh_pul(self):
+    post = self.fetch(); regs = ('cc', 'a', 'b', 'dp', 'x', 'y', 's' if self.buffer[self.location - 2] & 2 else 'u', 'pc')
     return ','.join([reg for i, reg in enumerate(regs) if post & 1 << i])
 
 
@@ -116,17 +106,13 @@ for i, op in {3:'CMPU', 0xc:'CMPS'}.items():
     table_11[0x90 | i] = (f'{op} <n', '', f'{op}\t<%s', byte)
     table_11[0xa0 | i] = (f'{op} ,r', '', f'{op}\t%s', am_index)
     table_11[0xb0 | i] = (f'{op} >nn', '', f'{op}\t%s', word)
+table_11 = compile_table(table_11)
 
 
-def op_11():
-    global flags, table_11
-    opcode = fetch()
-    if opcode not in table_11:
-        return ''
-    t = table_11[opcode]
-    flags = t[1]
-    operands = [f() for f in t[3:]]
-    return functools.reduce(lambda a, b : a.replace('%s', b, 1), operands, t[2].lower()) if '' not in operands else ''
+def op_11(self):
+    self.flags, fmt, fnc = table_11[self.fetch()]
+    operands = [f(self) for f in fnc]
+    return fmt.format(*operands) if '' not in operands else ''
 
 
 table_10 = {
@@ -146,17 +132,13 @@ for i, op in {0xe:'LDS', 0xf:'STS'}.items():
     table_10[0xd0 | i] = (f'{op} <n', '', f'{op}\t<%s', byte)
     table_10[0xe0 | i] = (f'{op} ,r', '', f'{op}\t%s', am_index)
     table_10[0xf0 | i] = (f'{op} >nn', '', f'{op}\t%s', word)
+table_10 = compile_table(table_10)
 
 
-def op_10():
-    global flags, table_10
-    opcode = fetch()
-    if opcode not in table_10:
-        return ''
-    t = table_10[opcode]
-    flags = t[1]
-    operands = [f() for f in t[3:]]
-    return functools.reduce(lambda a, b : a.replace('%s', b, 1), operands, t[2].lower()) if '' not in operands else ''
+def op_10(self):
+    self.flags, fmt, fnc = table_10[self.fetch()]
+    operands = [f(self) for f in fnc]
+    return fmt.format(*operands) if '' not in operands else ''
 
 
 table = {
@@ -166,7 +148,7 @@ table = {
     0x12: ('NOP',     '',   'NOP'),
     0x13: ('SYNC',    '',   'SYNC'),
     0x16: ('LBRA',    'AB', 'LBRA\t%s',   am_lrelative),
-    0x17: ('LBSR',    'B',  'LBSR\t%s',   am_lrelative),
+    0x17: ('LBSR',    'BC', 'LBSR\t%s',   am_lrelative),
     0x19: ('DAA',     '',   'DAA'),
     0x1a: ('ORCC',    '',   'ORCC\t#%s',  byte),
     0x1c: ('ANDCC',   '',   'ANDCC\t#%s', byte),
@@ -182,10 +164,10 @@ table = {
     0x3f: ('SWI',     '',   'SWI'),
     0x6e: ('JMP ,r',  'A',  'JMP\t%s',    am_index),
     0x7e: ('JMP >nn', 'AB', 'JMP\t%s',    word),
-    0x8d: ('BSR',     'B',  'BSR\t%s',    am_relative),
-    0x9d: ('JSR <n',  'B',  'JSR\t<%s',  byte),
-    0xad: ('JSR ,r',  'B',  'JSR\t%s',   am_index),
-    0xbd: ('JSR >nn', 'B',  'JSR\t%s',    word),
+    0x8d: ('BSR',     'BC', 'BSR\t%s',    am_relative),
+    0x9d: ('JSR <n',  'BC', 'JSR\t<%s',  byte),
+    0xad: ('JSR ,r',  'BC', 'JSR\t%s',   am_index),
+    0xbd: ('JSR >nn', 'BC', 'JSR\t%s',    word),
 }
 
 for i, op in {0:'NEG', 3:'COM', 4:'LSR', 6:'ROR', 7:'ASR', 8:'LSL', 9:'ROL', 0xa:'DEC', 0xc:'INC', 0xd:'TST', 0xf:'CLR'}.items():
@@ -216,169 +198,354 @@ for i, op in enumerate(('SUBB', 'CMPB', 'SBCB', 'ADDD', 'ANDB', 'BITB', 'LDB', '
     table[0xd0 | i] = (f'{op} <n', '', f'{op}\t<%s', byte)
     table[0xe0 | i] = (f'{op} ,r', '', f'{op}\t%s', am_index)
     table[0xf0 | i] = (f'{op} >nn', '', f'{op}\t%s', word)
-
-
-def op():
-    global flags, table
-    opcode = fetch()
-    if opcode not in table:
-        flags = ''
-        return ''
-    t = table[opcode]
-    flags = t[1]
-    operands = [f() for f in t[3:]]
-    return functools.reduce(lambda a, b : a.replace('%s', b, 1), operands, t[2].lower()) if '' not in operands else ''
-
-
-# main
-opts, args = getopt.getopt(sys.argv[1:], "e:flo:s:t:")
-if len(args) == 0:
-    print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
-    print(f'オプション:')
-    print(f'  -e <アドレス>   エントリ番地を指定する')
-    print(f'  -f              強制的に逆アセンブルする')
-    print(f'  -l              アドレスとデータを出力する')
-    print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
-    print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
-    print(f'  -t <ファイル名> ラベルテーブルを使用する')
-    sys.exit(0)
-remark = {}
-attrib = bytearray(len(buffer))
-start = 0
-listing = False
-force = False
-noentry = True
-file = sys.stdout
-tablefile = None
-for o, a in opts:
-    if o == '-e':
-        jumplabel[int(a, 0)] = True
-        noentry = False
-    elif o == '-f':
-        force = True
-    elif o == '-l':
-        listing = True
-    elif o == '-o':
-        file = open(a, 'w', encoding='utf-8')
-    elif o == '-s':
-        start = int(a, 0)
-    elif o == '-t':
-        tablefile = open(a, 'r', encoding='utf-8')
-with open(args[0], 'rb') as f:
-    data = f.read()[:len(buffer) - start]; end = start + len(data)
-    buffer[start:end] = data
-if tablefile:
-    for line in tablefile:
-        words = line.split(' ')
-        if words[0] == 'b':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'B' * size
-        elif words[0] == 'c':
-            jumplabel[int(words[1], 16)] = True
+table = compile_table(table)
+
+
+def op(self):
+    self.flags, fmt, fnc = table[self.fetch()]
+    operands = [f(self) for f in fnc]
+    return fmt.format(*operands) if '' not in operands else ''
+
+
+class MC6809Disassembler:
+    align = 1
+
+    def __init__(self, image, start=0, entries=(), labels=(), force=False):
+        self.buffer = bytearray(0x10000)
+        self.jumplabel = [False] * len(self.buffer)
+        self.label = [False] * len(self.buffer)
+        self.remark = {}
+        self.attrib = bytearray(len(self.buffer))
+        self.length = bytearray(len(self.buffer))
+        self.decoded = [None] * len(self.buffer)
+        self.pending = []
+        self.location = 0
+        self.flags = ''
+        self.origin = None
+        self.xref = array.array('i')
+        self.force = force
+        data = image[:len(self.buffer) - start]
+        self.start = start; self.end = start + len(data)
+        self.buffer[self.start:self.end] = data
+        noentry = True
+        for ea in entries:
+            self.jumplabel[ea] = True
             noentry = False
-        elif words[0] == 'd':
-            label[int(words[1], 16)] = True
-        elif words[0] == 'r':
-            addr = int(words[1], 16)
-            if addr not in remark:
-                remark[addr] = []
-            remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
-        elif words[0] == 's':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'S' * size
-        elif words[0] == 't':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                jumplabel[buffer[i] << 8 | buffer[i + 1]] = True
+        if self.parse(labels):
             noentry = False
-        elif words[0] == 'u':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] << 8 | buffer[i + 1]] = True
-        elif words[0] == 'v':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 3, 3):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] << 8 | buffer[i + 1]] = True
-
-# path 1
-if noentry:
-    jumplabel[start] = True
-while (location := next((start + i for i, (a, l) in enumerate(zip(attrib[start:end], jumplabel[start:end])) if not a and l), end)) != end:
-    while True:
-        base = location
-        op()
-        attrib[base:location] = b'C' * (location - base)
-        if not force and 'A' in flags or location >= end or attrib[location]:
-            break
-
-# path 2
-if listing:
-    print(f'\t\t\t************************************************', file=file)
-    print(f'\t\t\t*\tMC6809 disassembler', file=file)
-    print(f'\t\t\t*\tfilename: {args[0]}', file=file)
-    print(f'\t\t\t************************************************', file=file)
-    print(f'\t\t\t\torg\t${start:04x}', file=file)
-    print(f'\t\t\t', file=file)
-else:
-    print(f'************************************************', file=file)
-    print(f'*\tMC6809 disassembler', file=file)
-    print(f'*\tfilename: {args[0]}', file=file)
-    print(f'************************************************', file=file)
-    print(f'\torg\t${start:04x}', file=file)
-    print(f'', file=file)
-location = start
-while location < end:
-    base = location
-    if base in remark:
-        for s in remark[base]:
-            if listing:
-                print(f'{base:04X}\t\t\t', end='', file=file)
-            print(f'*{s}', file=file)
-    if attrib[base] == b'C'[0]:
-        s = op(); size = location - base
+        if noentry:
+            self.jumplabel[start] = True
+        self.trace()
+
+    def parse(self, labels):
+        entry = False
+        for line in labels:
+            words = line.split(' ')
+            if words[0] == 'b':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'B' * size
+            elif words[0] == 'c':
+                self.jumplabel[int(words[1], 16)] = True
+                entry = True
+            elif words[0] == 'd':
+                self.label[int(words[1], 16)] = True
+            elif words[0] == 'g':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'G' * size
+            elif words[0] == 'r':
+                addr = int(words[1], 16)
+                if addr not in self.remark:
+                    self.remark[addr] = []
+                self.remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
+            elif words[0] == 's':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'S' * size
+            elif words[0] == 't':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] << 8 | self.buffer[i + 1]
+                    self.jumplabel[ea] = True
+                    self.refer(ea, 'P', i)
+                entry = True
+            elif words[0] == 'u':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] << 8 | self.buffer[i + 1]
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+            elif words[0] == 'v':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 3, 3):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] << 8 | self.buffer[i + 1]
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+        return entry
+
+    def fetch(self):
+        c = self.buffer[self.location]
+        self.location += 1
+        return c
+
+    def fetch16(self):
+        return self.fetch() << 8 | self.fetch()
+
+    def jump(self, ea):
+        if not self.jumplabel[ea]:
+            self.jumplabel[ea] = True
+            heapq.heappush(self.pending, ea)
+
+    def refer(self, ea, kind=None, origin=None):
+        if origin is None:
+            origin = self.origin
+        if origin is not None:
+            self.xref.extend((ea, origin, ord(kind or ('C' if 'C' in self.flags else 'J' if 'B' in self.flags else 'R'))))
+
+    def trace(self):
+        self.pending = [i for i in range(self.start, self.end) if self.jumplabel[i]]
+        while self.pending:
+            self.location = heapq.heappop(self.pending)
+            if self.location < self.start or self.location >= self.end or self.attrib[self.location]:
+                continue
+            while True:
+                base = self.origin = self.location
+                self.decoded[base] = op(self)
+                self.length[base] = self.location - base
+                self.attrib[base:self.location] = b'C' * (self.location - base)
+                if not self.force and 'A' in self.flags or self.location >= self.end or self.attrib[self.location]:
+                    break
+        self.origin = None
+
+    def decode(self, addr):
+        self.location = addr
+        return op(self)
+
+    def split(self, count):
+        cuts = [self.start]; decodes = []
+        self.location = self.start
+        while self.location < self.end:
+            base = self.location
+            if base >= self.start + (self.end - self.start) * len(cuts) // count:
+                cuts += [base]
+            if self.attrib[base] != b'C'[0]:
+                self.location = self.extent(base)
+            elif self.length[base]:
+                self.location = base + self.length[base]
+            else:
+                decodes += [base]
+                op(self)
+        return cuts + [self.end], decodes
+
+    def extent(self, base):
+        if self.attrib[base] == b'S'[0]:
+            return dasm.stretch(self.attrib, self.label, base + 1, self.end, b'S'[0])
+        if self.attrib[base] == b'B'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 1 + i for i, (a, l) in enumerate(zip(self.attrib[base + 1:limit], self.label[base + 1:limit])) if a != b'B'[0] or l), limit)
+        if self.attrib[base] == b'P'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(self.attrib[base + 2:limit:2], self.label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
+        if self.attrib[base] == b'G'[0]:
+            return dasm.span(self.attrib, base + 1, self.end, b'G'[0])
+        return base + 1
+
+    def records(self, begin=None, stop=None):
+        self.location = self.start if begin is None else begin
+        stop = self.end if stop is None else stop
+        while self.location < stop:
+            base = self.location
+            if base in self.remark:
+                for s in self.remark[base]:
+                    yield base, b'', '', s, 'R'
+            if self.attrib[base] == b'C'[0]:
+                if self.length[base]:
+                    s = self.decoded[base]; self.location = base + self.length[base]
+                else:
+                    s = op(self)
+                data = bytes(self.buffer[base:self.location])
+                name = f'L{base:04x}' if self.jumplabel[base] else ''
+                yield base, data, name, s if s else 'fcb\t' + ','.join([f'${c:02x}' for c in data]), 'C'
+            elif self.attrib[base] == b'S'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, f'fcc\t\'{data.decode()}\'', 'S'
+            elif self.attrib[base] == b'B'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, 'fcb\t' + ','.join([f'${c:02x}' for c in data]), 'B'
+            elif self.attrib[base] == b'P'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                yield base, bytes(self.buffer[base:self.location]), name, 'fdb\t' + ','.join([f'L{self.buffer[i]:02x}{self.buffer[i + 1]:02x}' for i in range(base, self.location, 2)]), 'P'
+            elif self.attrib[base] == b'G'[0]:
+                self.location = self.extent(base)
+                if self.location < self.end:
+                    yield self.location, b'', '', f'org\t${self.location:04x}', 'G'
+            else:
+                c = self.fetch()
+                name = f'L{base:04x}' if self.label[base] else ''
+                yield base, bytes([c]), name, f'fcb\t${c:02x}' + (f'\t\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), ''
+
+    def lines(self, filename, listing=False):
+        yield from self.header(filename, listing)
+        yield from self.body(listing)
+        yield from self.footer(listing)
+
+    def header(self, filename, listing=False):
         if listing:
-            print(f'{base:04X} ' + ''.join([f' {c:02X}' for c in buffer[base:location]]) + '\t' * (26 - size * 3 >> 3), end='', file=file)
-        if jumplabel[base]:
-            print(f'L{base:04x}', end='', file=file)
-        print(f'\t{s}' if s else '\tfcb\t' + ','.join([f'${c:02x}' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'S'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:end], label[base + 1:end])) if a != b'S'[0] or l), end)
-        print(f'\tfcc\t\'{buffer[base:location].decode()}\'', file=file)
-    elif attrib[base] == b'B'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:limit], label[base + 1:limit])) if a != b'B'[0] or l), limit)
-        print(f'\tfcb\t' + ','.join([f'${c:02x}' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'P'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(attrib[base + 2:limit:2], label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
-        print(f'\tfdb\t' + ','.join([f'L{buffer[i]:02x}{buffer[i + 1]:02x}' for i in range(base, location, 2)]), file=file)
+            yield f'\t\t\t************************************************\n'
+            yield f'\t\t\t*\tMC6809 disassembler\n'
+            yield f'\t\t\t*\tfilename: {filename}\n'
+            yield f'\t\t\t************************************************\n'
+            yield f'\t\t\t\torg\t${self.start:04x}\n'
+            yield f'\t\t\t\n'
+        else:
+            yield f'************************************************\n'
+            yield f'*\tMC6809 disassembler\n'
+            yield f'*\tfilename: {filename}\n'
+            yield f'************************************************\n'
+            yield f'\torg\t${self.start:04x}\n'
+            yield f'\n'
+
+    def body(self, listing=False, begin=None, stop=None):
+        for base, data, name, s, kind in self.records(begin, stop):
+            if not listing:
+                prefix = ''
+            elif kind == 'C':
+                prefix = f'{base:04X} ' + ''.join([f' {c:02X}' for c in data]) + '\t' * (26 - len(data) * 3 >> 3)
+            elif kind:
+                prefix = f'{base:04X}\t\t\t'
+            else:
+                prefix = f'{base:04X}  {data[0]:02X}\t\t'
+            if kind == 'R':
+                yield f'{prefix}*{s}\n'
+            else:
+                yield f'{prefix}{name}\t{s}\n'
+
+    def footer(self, listing=False):
+        yield (f'{self.location & 0xffff:04X}\t\t\t' if listing else '') + '\tend\n'
+
+
+options = "b:c:d:e:fj:k:lo:rs:t:x:"
+
+
+def main(argv=None):
+    opts, args = getopt.getopt(sys.argv[1:] if argv is None else argv, options, ['watch'])
+    if len(args) == 0:
+        print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
+        print(f'オプション:')
+        print(f'  -b <バイト数>   出力バッファのサイズを指定する(デフォルト:1048576)')
+        print(f'  -c <フォルダ>   解析結果をキャッシュするフォルダを指定する')
+        print(f'  -d <ファイル名> 解析結果をバイナリ形式で書き出す(mmap可能)')
+        print(f'  -e [<バンク>:]<アドレス> エントリ番地を指定する')
+        print(f'  -f              強制的に逆アセンブルする')
+        print(f'  -j <プロセス数> 出力を並列に生成する(デフォルト:1)')
+        print(f'  -k <アドレス>:<バイト数>[:<位置>] バンク切り替えの窓の番地とサイズを指定する')
+        print(f'  -l              アドレスとデータを出力する')
+        print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
+        print(f'  -r              相互参照をコメントとして出力する')
+        print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
+        print(f'  -t <ファイル名> ラベルテーブルを使用する')
+        print(f'  -x <ファイル名> 相互参照の一覧を書き出す')
+        print(f'  --watch         入力ファイルとラベルテーブルの変更を監視して出力ファイルを更新する')
+        print(f'ファイル名:')
+        print(f'  <アーカイブ>.zip:<メンバー名> でzipアーカイブの中のファイルを直接読み込む')
+        print(f'  拡張子が.gz/.xzのファイルは展開しながら読み込む')
+        print(f'  拡張子が.hex/.ihx(Intel HEX)、.mot/.s19/.s28/.s37/.srec(Sレコード)のファイルはレコードのある範囲だけを読み込む')
+        print(f'バンク(-k):')
+        print(f'  ファイルの<位置>(デフォルト:0)から-sの番地に置く固定領域を読み、残りを窓のサイズのバンクに分ける')
+        print(f'  固定領域は-sから窓の手前まで(窓が-sより下にあるときは$ffffまで)')
+        print(f'  -eとラベルテーブルの番地を<バンク>:<番地>と書くとそのバンクだけに適用する(バンクは10進数)')
+        sys.exit(0)
+    start = 0
+    listing = False
+    force = False
+    jobs = 1
+    entries = []
+    output = None
+    bufsize = 0x100000
+    cache = None
+    labels = ()
+    table = None
+    watch = False
+    comments = False
+    xrefs = None
+    mapfile = None
+    window = None
+    for o, a in opts:
+        if o == '-b':
+            bufsize = int(a, 0)
+        elif o == '-c':
+            cache = a
+        elif o == '-d':
+            mapfile = a
+        elif o == '-e':
+            entries += [dasm.address(a)]
+        elif o == '-f':
+            force = True
+        elif o == '-j':
+            jobs = int(a, 0)
+        elif o == '-k':
+            try:
+                window = [int(x, 0) for x in a.split(':')] + [0]
+            except ValueError:
+                window = []
+            if not 3 <= len(window) <= 4 or min(window) < 0 or window[1] == 0:
+                print(f'{os.path.basename(sys.argv[0])}: -k は<アドレス>:<バイト数>[:<位置>]で指定してください', file=sys.stderr)
+                sys.exit(2)
+        elif o == '-l':
+            listing = True
+        elif o == '-o':
+            output = a
+        elif o == '-r':
+            comments = True
+        elif o == '-s':
+            start = int(a, 0)
+        elif o == '-t':
+            table = a
+            with open(a, 'r', encoding='utf-8') as f:
+                labels = f.readlines()
+        elif o == '-x':
+            xrefs = a
+        elif o == '--watch':
+            watch = True
+    if not window and any(isinstance(ea, tuple) for ea in entries):
+        print(f'{os.path.basename(sys.argv[0])}: <バンク>:<アドレス> の指定には-kが必要です', file=sys.stderr)
+        sys.exit(2)
+    if not window and dasm.prefixed(labels):
+        print(f'{os.path.basename(sys.argv[0])}: {table}:{dasm.prefixed(labels)[0]}: <バンク>:<アドレス> の指定には-kが必要です', file=sys.stderr)
+        sys.exit(2)
+    load = None
+    if dasm.hexfile(args[0]):
+        def load():
+            return dasm.segments(args[0])
+    if watch:
+        if window:
+            print(f'{os.path.basename(sys.argv[0])}: --watch は-kと同時に使えません', file=sys.stderr)
+            sys.exit(2)
+        dasm.watch(MC6809Disassembler, args[0], table, output, start, entries, force, listing, jobs, bufsize, comments, xrefs, mapfile, load)
+        return
+    if load:
+        image, start, gaps = load()
+        labels = gaps + list(labels)
     else:
-        c = fetch()
-        if listing:
-            print(f'{base:04X}  {c:02X}\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        print(f'\tfcb\t${c:02x}' + (f'\t\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), file=file)
-if listing:
-    print(f'{location & 0xffff:04X}\t\t\t', end='', file=file)
-print('\tend', file=file)
+        image = dasm.read(args[0])
+    with dasm.create(output, bufsize) as file:
+        if window:
+            file.writelines(dasm.banked(MC6809Disassembler, args[0], image, start, *window[:3], entries, labels, force, listing, jobs, cache, comments, xrefs, mapfile))
+        else:
+            file.writelines(dasm.output(MC6809Disassembler, args[0], image, start, entries, labels, force, listing, jobs, cache, comments, xrefs, mapfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,47 +2,42 @@
 #   MCS6502 disassembler
 #
 
-import functools
+import array
+import dasm
 import getopt
+import heapq
 import os
 import sys
 
-buffer = bytearray(0x10000)
-jumplabel = [False] * len(buffer)
-label = [False] * len(buffer)
-location = 0
-flags = ''
+illegal = ('', '', '')
 
 
 def s8(x):
     return x & 0x7f | -(x & 0x80)
 
 
-def fetch():
-    global buffer, location
-    c = buffer[location]
-    location += 1
-    return c
+def compile_table(table, size=0x100):
+    return [(t[1], t[2].lower().replace('%s', '{}'), t[3:]) for t in (table.get(i, illegal) for i in range(size))]
 
 
-def byte():
-    return f'${fetch():02x}'
+def byte(self):
+    return f'${self.fetch():02x}'
 
 
-def word():
-    global jumplabel, label, flags
-    operand = fetch() | fetch() << 8
-    if 'B' in flags:
-        jumplabel[operand] = True
+def word(self):
+    operand = self.fetch() | self.fetch() << 8
+    if 'B' in self.flags:
+        self.jump(operand)
     else:
-        label[operand] = True
+        self.label[operand] = True
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
-def am_relative():
-    global jumplabel, label, location, flags
-    operand = s8(fetch()) + location & 0xffff
-    jumplabel[operand] = True
+def am_relative(self):
+    operand = s8(self.fetch()) + self.location & 0xffff
+    self.jump(operand)
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
@@ -51,7 +46,7 @@ table = {
     0x08: ('PHP',       '',   'PHP'),
     0x10: ('BPL',       'B',  'BPL\t%s',     am_relative),
     0x18: ('CLC',       '',   'CLC'),
-    0x20: ('JSR nn',    'B',  'JSR\t%s',     word),
+    0x20: ('JSR nn',    'BC', 'JSR\t%s',     word),
     0x28: ('PLP',       '',   'PLP'),
     0x30: ('BMI',       'B',  'BMI\t%s',     am_relative),
     0x38: ('SEC',       '',   'SEC'),
@@ -110,168 +105,346 @@ for i, op in {0x20:'BIT', 0x80:'STY', 0x82:'STX', 0xa0:'LDY', 0xa2:'LDX', 0xc0:'
     table[0x0c | i] = (f'{op} nn', '', f'{op}\t%s', word)
 for i, op in {0x02:'ASL', 0x22:'ROL', 0x42:'LSR', 0x62:'ROR'}.items():
     table[0x08 | i] = (f'{op}A', '', f'{op}A')
+table = compile_table(table)
 
 
-def op():
-    global flags, table
-    opcode = fetch()
-    if opcode not in table:
-        flags = ''
-        return ''
-    t = table[opcode]
-    flags = t[1]
-    return functools.reduce(lambda a, b : a.replace('%s', b(), 1), t[3:], t[2].lower())
-
-
-# main
-opts, args = getopt.getopt(sys.argv[1:], "e:flo:s:t:")
-if len(args) == 0:
-    print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
-    print(f'オプション:')
-    print(f'  -e <アドレス>   エントリ番地を指定する')
-    print(f'  -f              強制的に逆アセンブルする')
-    print(f'  -l              アドレスとデータを出力する')
-    print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
-    print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
-    print(f'  -t <ファイル名> ラベルテーブルを使用する')
-    sys.exit(0)
-remark = {}
-attrib = bytearray(len(buffer))
-start = 0
-listing = False
-force = False
-noentry = True
-file = sys.stdout
-tablefile = None
-for o, a in opts:
-    if o == '-e':
-        jumplabel[int(a, 0)] = True
-        noentry = False
-    elif o == '-f':
-        force = True
-    elif o == '-l':
-        listing = True
-    elif o == '-o':
-        file = open(a, 'w', encoding='utf-8')
-    elif o == '-s':
-        start = int(a, 0)
-    elif o == '-t':
-        tablefile = open(a, 'r', encoding='utf-8')
-with open(args[0], 'rb') as f:
-    data = f.read()[:len(buffer) - start]; end = start + len(data)
-    buffer[start:end] = data
-if tablefile:
-    for line in tablefile:
-        words = line.split(' ')
-        if words[0] == 'b':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'B' * size
-        elif words[0] == 'c':
-            jumplabel[int(words[1], 16)] = True
+def op(self):
+    self.flags, fmt, fnc = table[self.fetch()]
+    return fmt.format(*[f(self) for f in fnc])
+
+
+class MCS6502Disassembler:
+    align = 1
+
+    def __init__(self, image, start=0, entries=(), labels=(), force=False):
+        self.buffer = bytearray(0x10000)
+        self.jumplabel = [False] * len(self.buffer)
+        self.label = [False] * len(self.buffer)
+        self.remark = {}
+        self.attrib = bytearray(len(self.buffer))
+        self.length = bytearray(len(self.buffer))
+        self.decoded = [None] * len(self.buffer)
+        self.pending = []
+        self.location = 0
+        self.flags = ''
+        self.origin = None
+        self.xref = array.array('i')
+        self.force = force
+        data = image[:len(self.buffer) - start]
+        self.start = start; self.end = start + len(data)
+        self.buffer[self.start:self.end] = data
+        noentry = True
+        for ea in entries:
+            self.jumplabel[ea] = True
             noentry = False
-        elif words[0] == 'd':
-            label[int(words[1], 16)] = True
-        elif words[0] == 'r':
-            addr = int(words[1], 16)
-            if addr not in remark:
-                remark[addr] = []
-            remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
-        elif words[0] == 's':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'S' * size
-        elif words[0] == 't':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                jumplabel[buffer[i] | buffer[i + 1] << 8] = True
+        if self.parse(labels):
             noentry = False
-        elif words[0] == 'u':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] | buffer[i + 1] << 8] = True
-        elif words[0] == 'v':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 3, 3):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] | buffer[i + 1] << 8] = True
-
-# path 1
-if noentry:
-    jumplabel[start] = True
-while (location := next((start + i for i, (a, l) in enumerate(zip(attrib[start:end], jumplabel[start:end])) if not a and l), end)) != end:
-    while True:
-        base = location
-        op()
-        attrib[base:location] = b'C' * (location - base)
-        if not force and 'A' in flags or location >= end or attrib[location]:
-            break
-
-# path 2
-if listing:
-    print(f'\t\t\t************************************************', file=file)
-    print(f'\t\t\t*\tMCS6502 disassembler', file=file)
-    print(f'\t\t\t*\tfilename: {args[0]}', file=file)
-    print(f'\t\t\t************************************************', file=file)
-    print(f'\t\t\t\torg\t${start:04x}', file=file)
-    print(f'\t\t\t', file=file)
-else:
-    print(f'************************************************', file=file)
-    print(f'*\tMCS6502 disassembler', file=file)
-    print(f'*\tfilename: {args[0]}', file=file)
-    print(f'************************************************', file=file)
-    print(f'\torg\t${start:04x}', file=file)
-    print(f'', file=file)
-location = start
-while location < end:
-    base = location
-    if base in remark:
-        for s in remark[base]:
-            if listing:
-                print(f'{base:04X}\t\t\t', end='', file=file)
-            print(f'*{s}', file=file)
-    if attrib[base] == b'C'[0]:
-        s = op(); size = location - base
-        if listing:
-            print(f'{base:04X} ' + ''.join([f' {c:02X}' for c in buffer[base:location]]) + '\t' * (26 - size * 3 >> 3), end='', file=file)
-        if jumplabel[base]:
-            print(f'L{base:04x}', end='', file=file)
-        print(f'\t{s}' if s else '\tfcb\t' + ','.join([f'${c:02x}' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'S'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:end], label[base + 1:end])) if a != b'S'[0] or l), end)
-        print(f'\tfcc\t\'{buffer[base:location].decode()}\'', file=file)
-    elif attrib[base] == b'B'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:limit], label[base + 1:limit])) if a != b'B'[0] or l), limit)
-        print(f'\tfcb\t' + ','.join([f'${c:02x}' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'P'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(attrib[base + 2:limit:2], label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
-        print(f'\tfdb\t' + ','.join([f'L{buffer[i + 1]:02x}{buffer[i]:02x}' for i in range(base, location, 2)]), file=file)
-    else:
-        c = fetch()
+        if noentry:
+            self.jumplabel[start] = True
+        self.trace()
+
+    def parse(self, labels):
+        entry = False
+        for line in labels:
+            words = line.split(' ')
+            if words[0] == 'b':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'B' * size
+            elif words[0] == 'c':
+                self.jumplabel[int(words[1], 16)] = True
+                entry = True
+            elif words[0] == 'd':
+                self.label[int(words[1], 16)] = True
+            elif words[0] == 'r':
+                addr = int(words[1], 16)
+                if addr not in self.remark:
+                    self.remark[addr] = []
+                self.remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
+            elif words[0] == 's':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'S' * size
+            elif words[0] == 't':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.jumplabel[ea] = True
+                    self.refer(ea, 'P', i)
+                entry = True
+            elif words[0] == 'u':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+            elif words[0] == 'v':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 3, 3):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+        return entry
+
+    def fetch(self):
+        c = self.buffer[self.location]
+        self.location += 1
+        return c
+
+    def jump(self, ea):
+        if not self.jumplabel[ea]:
+            self.jumplabel[ea] = True
+            heapq.heappush(self.pending, ea)
+
+    def refer(self, ea, kind=None, origin=None):
+        if origin is None:
+            origin = self.origin
+        if origin is not None:
+            self.xref.extend((ea, origin, ord(kind or ('C' if 'C' in self.flags else 'J' if 'B' in self.flags else 'R'))))
+
+    def trace(self):
+        self.pending = [i for i in range(self.start, self.end) if self.jumplabel[i]]
+        while self.pending:
+            self.location = heapq.heappop(self.pending)
+            if self.location < self.start or self.location >= self.end or self.attrib[self.location]:
+                continue
+            while True:
+                base = self.origin = self.location
+                self.decoded[base] = op(self)
+                self.length[base] = self.location - base
+                self.attrib[base:self.location] = b'C' * (self.location - base)
+                if not self.force and 'A' in self.flags or self.location >= self.end or self.attrib[self.location]:
+                    break
+        self.origin = None
+
+    def decode(self, addr):
+        self.location = addr
+        return op(self)
+
+    def split(self, count):
+        cuts = [self.start]; decodes = []
+        self.location = self.start
+        while self.location < self.end:
+            base = self.location
+            if base >= self.start + (self.end - self.start) * len(cuts) // count:
+                cuts += [base]
+            if self.attrib[base] != b'C'[0]:
+                self.location = self.extent(base)
+            elif self.length[base]:
+                self.location = base + self.length[base]
+            else:
+                decodes += [base]
+                op(self)
+        return cuts + [self.end], decodes
+
+    def extent(self, base):
+        if self.attrib[base] == b'S'[0]:
+            return dasm.stretch(self.attrib, self.label, base + 1, self.end, b'S'[0])
+        if self.attrib[base] == b'B'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 1 + i for i, (a, l) in enumerate(zip(self.attrib[base + 1:limit], self.label[base + 1:limit])) if a != b'B'[0] or l), limit)
+        if self.attrib[base] == b'P'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(self.attrib[base + 2:limit:2], self.label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
+        return base + 1
+
+    def records(self, begin=None, stop=None):
+        self.location = self.start if begin is None else begin
+        stop = self.end if stop is None else stop
+        while self.location < stop:
+            base = self.location
+            if base in self.remark:
+                for s in self.remark[base]:
+                    yield base, b'', '', s, 'R'
+            if self.attrib[base] == b'C'[0]:
+                if self.length[base]:
+                    s = self.decoded[base]; self.location = base + self.length[base]
+                else:
+                    s = op(self)
+                data = bytes(self.buffer[base:self.location])
+                name = f'L{base:04x}' if self.jumplabel[base] else ''
+                yield base, data, name, s if s else 'fcb\t' + ','.join([f'${c:02x}' for c in data]), 'C'
+            elif self.attrib[base] == b'S'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, f'fcc\t\'{data.decode()}\'', 'S'
+            elif self.attrib[base] == b'B'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, 'fcb\t' + ','.join([f'${c:02x}' for c in data]), 'B'
+            elif self.attrib[base] == b'P'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                yield base, bytes(self.buffer[base:self.location]), name, 'fdb\t' + ','.join([f'L{self.buffer[i + 1]:02x}{self.buffer[i]:02x}' for i in range(base, self.location, 2)]), 'P'
+            else:
+                c = self.fetch()
+                name = f'L{base:04x}' if self.label[base] else ''
+                yield base, bytes([c]), name, f'fcb\t${c:02x}' + (f'\t\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), ''
+
+    def lines(self, filename, listing=False):
+        yield from self.header(filename, listing)
+        yield from self.body(listing)
+        yield from self.footer(listing)
+
+    def header(self, filename, listing=False):
         if listing:
-            print(f'{base:04X}  {c:02X}\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}', end='', file=file)
-        print(f'\tfcb\t${c:02x}' + (f'\t\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), file=file)
-if listing:
-    print(f'{location & 0xffff:04X}\t\t\t', end='', file=file)
-print('\tend', file=file)
+            yield f'\t\t\t************************************************\n'
+            yield f'\t\t\t*\tMCS6502 disassembler\n'
+            yield f'\t\t\t*\tfilename: {filename}\n'
+            yield f'\t\t\t************************************************\n'
+            yield f'\t\t\t\torg\t${self.start:04x}\n'
+            yield f'\t\t\t\n'
+        else:
+            yield f'************************************************\n'
+            yield f'*\tMCS6502 disassembler\n'
+            yield f'*\tfilename: {filename}\n'
+            yield f'************************************************\n'
+            yield f'\torg\t${self.start:04x}\n'
+            yield f'\n'
+
+    def body(self, listing=False, begin=None, stop=None):
+        for base, data, name, s, kind in self.records(begin, stop):
+            if not listing:
+                prefix = ''
+            elif kind == 'C':
+                prefix = f'{base:04X} ' + ''.join([f' {c:02X}' for c in data]) + '\t' * (26 - len(data) * 3 >> 3)
+            elif kind:
+                prefix = f'{base:04X}\t\t\t'
+            else:
+                prefix = f'{base:04X}  {data[0]:02X}\t\t'
+            if kind == 'R':
+                yield f'{prefix}*{s}\n'
+            else:
+                yield f'{prefix}{name}\t{s}\n'
+
+    def footer(self, listing=False):
+        yield (f'{self.location & 0xffff:04X}\t\t\t' if listing else '') + '\tend\n'
+
+
+def banks(image, size=None):
+    if image[:4] == b'NES\x1a':
+        count = image[4] | (image[9] & 0x0f) << 8 if image[7] & 0x0c == 0x08 else image[4]
+        offset = 16 + (0x200 if image[6] & 4 else 0)
+        image = image[offset:offset + count * 0x4000]
+    elif not size:
+        return None
+    size = size or 0x4000
+    return [image[i:i + size] for i in range(0, len(image), size)]
+
+
+options = "a:b:c:d:e:fj:k:lo:rs:t:x:"
+
+
+def main(argv=None):
+    opts, args = getopt.getopt(sys.argv[1:] if argv is None else argv, options, ['watch'])
+    if len(args) == 0:
+        print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
+        print(f'オプション:')
+        print(f'  -a <バンク>:<アドレス> PRGバンクを配置する番地を指定する(デフォルト:$8000、最後のバンクは末尾)')
+        print(f'  -b <バイト数>   出力バッファのサイズを指定する(デフォルト:1048576)')
+        print(f'  -c <フォルダ>   解析結果をキャッシュするフォルダを指定する')
+        print(f'  -d <ファイル名> 解析結果をバイナリ形式で書き出す(mmap可能)')
+        print(f'  -e [<バンク>:]<アドレス> エントリ番地を指定する')
+        print(f'  -f              強制的に逆アセンブルする')
+        print(f'  -j <プロセス数> 出力を並列に生成する(デフォルト:1)')
+        print(f'  -k <バイト数>   PRGバンクのサイズを指定する(デフォルト:16384)')
+        print(f'  -l              アドレスとデータを出力する')
+        print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
+        print(f'  -r              相互参照をコメントとして出力する')
+        print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
+        print(f'  -t <ファイル名> ラベルテーブルを使用する')
+        print(f'  -x <ファイル名> 相互参照の一覧を書き出す')
+        print(f'  --watch         入力ファイルとラベルテーブルの変更を監視して出力ファイルを更新する')
+        print(f'ファイル名:')
+        print(f'  <アーカイブ>.zip:<メンバー名> でzipアーカイブの中のファイルを直接読み込む')
+        print(f'  拡張子が.gz/.xzのファイルは展開しながら読み込む')
+        print(f'  iNESファイルと-kを指定したファイルはPRGバンクごとに続けて逆アセンブルする')
+        print(f'  -eとラベルテーブルの番地を<バンク>:<番地>(バンクは10進数)と書くとそのバンクだけに適用する')
+        print(f'  バンクを付けない番地は他のバンクと重ならない番地に置かれたバンクだけに適用する')
+        sys.exit(0)
+    start = 0
+    listing = False
+    force = False
+    jobs = 1
+    entries = []
+    output = None
+    bufsize = 0x100000
+    cache = None
+    labels = ()
+    table = None
+    watch = False
+    comments = False
+    xrefs = None
+    mapfile = None
+    mapping = {}
+    banksize = None
+    for o, a in opts:
+        if o == '-a':
+            try:
+                bank, addr = dasm.address(a)
+            except (TypeError, ValueError):
+                print(f'{os.path.basename(sys.argv[0])}: -a は<バンク>:<アドレス>で指定してください', file=sys.stderr)
+                sys.exit(2)
+            mapping[bank] = addr
+        elif o == '-b':
+            bufsize = int(a, 0)
+        elif o == '-c':
+            cache = a
+        elif o == '-d':
+            mapfile = a
+        elif o == '-e':
+            entries += [dasm.address(a)]
+        elif o == '-f':
+            force = True
+        elif o == '-j':
+            jobs = int(a, 0)
+        elif o == '-k':
+            banksize = int(a, 0)
+        elif o == '-l':
+            listing = True
+        elif o == '-o':
+            output = a
+        elif o == '-r':
+            comments = True
+        elif o == '-s':
+            start = int(a, 0)
+        elif o == '-t':
+            table = a
+            with open(a, 'r', encoding='utf-8') as f:
+                labels = f.readlines()
+        elif o == '-x':
+            xrefs = a
+        elif o == '--watch':
+            watch = True
+    if watch:
+        if banksize or dasm.read(args[0])[:4] == b'NES\x1a':
+            print(f'{os.path.basename(sys.argv[0])}: --watch はPRGバンクごとの逆アセンブルには使えません', file=sys.stderr)
+            sys.exit(2)
+        dasm.watch(MCS6502Disassembler, args[0], table, output, start, entries, force, listing, jobs, bufsize, comments, xrefs, mapfile)
+        return
+    image = dasm.read(args[0])
+    prg = banks(image, banksize)
+    if prg is None and any(isinstance(ea, tuple) for ea in entries):
+        print(f'{os.path.basename(sys.argv[0])}: <バンク>:<アドレス> の指定にはiNESファイルか-kが必要です', file=sys.stderr)
+        sys.exit(2)
+    bases = [mapping.get(n, 0x10000 - len(bank) if n == len(prg) - 1 else 0x8000) for n, bank in enumerate(prg or [])]
+    with dasm.create(output, bufsize) as file:
+        if prg is None:
+            file.writelines(dasm.output(MCS6502Disassembler, args[0], image, start, entries, labels, force, listing, jobs, cache, comments, xrefs, mapfile))
+        for n, (bank, base) in enumerate(zip(prg or [], bases)):
+            common = not any(m != n and b < base + len(bank) and base < b + len(prg[m]) for m, b in enumerate(bases))
+            vectors = [bank[i - base] | bank[i - base + 1] << 8 for i in (0xfffa, 0xfffc, 0xfffe) if base <= i < base + len(bank) - 1]
+            chosen = [ea[1] for ea in entries if isinstance(ea, tuple) and ea[0] == n] + [ea for ea in entries if common and not isinstance(ea, tuple)]
+            file.writelines(dasm.output(MCS6502Disassembler, f'{args[0]} (PRG {n})', bank, base, chosen + vectors, dasm.bank(labels, n, common), force, listing, jobs, cache, comments, xrefs and f'{xrefs}.{n}', mapfile and f'{mapfile}.{n}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,53 +2,48 @@
 #   Z80 disassembler
 #
 
-import functools
+import array
+import dasm
 import getopt
+import heapq
 import os
 import sys
 
-buffer = bytearray(0x10000)
-jumplabel = [False] * len(buffer)
-label = [False] * len(buffer)
-location = 0
-flags = ''
+illegal = ('', '', '')
 
 
 def s8(x):
     return x & 0x7f | -(x & 0x80)
 
 
-def fetch():
-    global buffer, location
-    c = buffer[location]
-    location += 1
-    return c
+def compile_table(table, size=0x100):
+    return [(t[1], t[2].lower().replace('%s', '{}'), t[3:]) for t in (table.get(i, illegal) for i in range(size))]
 
 
-def byte():
-    operand = fetch()
+def byte(self):
+    operand = self.fetch()
     return f'{operand:0{2 + (operand >= 0xa0)}x}h'
 
 
-def sbyte():
-    operand = s8(fetch())
+def sbyte(self):
+    operand = s8(self.fetch())
     return f'{operand:0=+3x}h'
 
 
-def word():
-    global jumplabel, label, flags
-    operand = fetch() | fetch() << 8
-    if 'B' in flags:
-        jumplabel[operand] = True
+def word(self):
+    operand = self.fetch() | self.fetch() << 8
+    if 'B' in self.flags:
+        self.jump(operand)
     else:
-        label[operand] = True
+        self.label[operand] = True
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
-def relative():
-    global jumplabel, label, location, flags
-    operand = s8(fetch()) + location & 0xffff
-    jumplabel[operand] = True
+def relative(self):
+    operand = s8(self.fetch()) + self.location & 0xffff
+    self.jump(operand)
+    self.refer(operand)
     return f'L{operand:04x}'
 
 
@@ -58,15 +53,12 @@ for i, op in {0x00:'RLC', 0x08:'RRC', 0x10:'RL', 0x18:'RR', 0x20:'SLA', 0x28:'SR
     table_fdcb[i | 6] = (f'{op} (IY+d)', '', f'{op}\t(IY%s)')
 for i, op, b, in [(i | b << 3, op, b) for i, op in {0x40:'BIT', 0x80:'RES', 0xc0:'SET'}.items() for b in range(8)]:
     table_fdcb[i | 6] = (f'{op} {b},(IY+d)', '', f'{op}\t{b},(IY%s)')
+table_fdcb = compile_table(table_fdcb)
 
 
-def op_fdcb():
-    global table_fdcb
-    d = sbyte()
-    opcode = fetch()
-    if opcode not in table_fdcb:
-        return ''
-    return table_fdcb[opcode][2].lower().replace('%s', d)
+def op_fdcb(self):
+    d = sbyte(self)
+    return table_fdcb[self.fetch()][1].format(d)
 
 
 table_ddcb = {}
@@ -75,15 +67,12 @@ for i, op in {0x00:'RLC', 0x08:'RRC', 0x10:'RL', 0x18:'RR', 0x20:'SLA', 0x28:'SR
     table_ddcb[i | 6] = (f'{op} (IX+d)', '', f'{op}\t(IX%s)')
 for i, op, b, in [(i | b << 3, op, b) for i, op in {0x40:'BIT', 0x80:'RES', 0xc0:'SET'}.items() for b in range(8)]:
     table_ddcb[i | 6] = (f'{op} {b},(IX+d)', '', f'{op}\t{b},(IX%s)')
+table_ddcb = compile_table(table_ddcb)
 
 
-def op_ddcb():
-    global table_ddcb
-    d = sbyte()
-    opcode = fetch()
-    if opcode not in table_ddcb:
-        return ''
-    return table_ddcb[opcode][2].lower().replace('%s', d)
+def op_ddcb(self):
+    d = sbyte(self)
+    return table_ddcb[self.fetch()][1].format(d)
 
 
 table_fd = {
@@ -145,16 +134,12 @@ for i, r in {0:'B', 1:'C', 2:'D', 3:'E', 7:'A'}.items():
     table_fd[0x45 | i << 3] = (f'LD {r},IYL', '', f'LD\t{r},IYL') # undefined operation
     table_fd[0x60 | i] = (f'LD IYH,{r}', '', f'LD\tIYH,{r}') # undefined operation
     table_fd[0x68 | i] = (f'LD IYL,{r}', '', f'LD\tIYL,{r}') # undefined operation
+table_fd = compile_table(table_fd)
 
 
-def op_fd():
-    global flags, table_fd
-    opcode = fetch()
-    if opcode not in table_fd:
-        return ''
-    t = table_fd[opcode]
-    flags = t[1]
-    return functools.reduce(lambda a, b : a.replace('%s', b(), 1), t[3:], t[2].lower())
+def op_fd(self):
+    self.flags, fmt, fnc = table_fd[self.fetch()]
+    return fmt.format(*[f(self) for f in fnc])
 
 
 table_ed = {
@@ -197,16 +182,12 @@ for i, rr in enumerate(('BC', 'DE', 'HL', 'SP')):
 for i, rr in {0:'BC', 1:'DE', 3:'SP'}.items():
     table_ed[0x43 | i << 4] = (f'LD (nn),{rr}', '', f'LD\t(%s),{rr}', word)
     table_ed[0x4b | i << 4] = (f'LD {rr},(nn)', '', f'LD\t{rr},(%s)', word)
+table_ed = compile_table(table_ed)
 
 
-def op_ed():
-    global flags, table_ed
-    opcode = fetch()
-    if opcode not in table_ed:
-        return ''
-    t = table_ed[opcode]
-    flags = t[1]
-    return functools.reduce(lambda a, b : a.replace('%s', b(), 1), t[3:], t[2].lower())
+def op_ed(self):
+    self.flags, fmt, fnc = table_ed[self.fetch()]
+    return fmt.format(*[f(self) for f in fnc])
 
 
 table_dd = {
@@ -268,16 +249,12 @@ for i, r in {0:'B', 1:'C', 2:'D', 3:'E', 7:'A'}.items():
     table_dd[0x45 | i << 3] = (f'LD {r},IXL', '', f'LD\t{r},IXL') # undefined operation
     table_dd[0x60 | i] = (f'LD IXH,{r}', '', f'LD\tIXH,{r}') # undefined operation
     table_dd[0x68 | i] = (f'LD IXL,{r}', '', f'LD\tIXL,{r}') # undefined operation
+table_dd = compile_table(table_dd)
 
 
-def op_dd():
-    global flags, table_dd
-    opcode = fetch()
-    if opcode not in table_dd:
-        return ''
-    t = table_dd[opcode]
-    flags = t[1]
-    return functools.reduce(lambda a, b : a.replace('%s', b(), 1), t[3:], t[2].lower())
+def op_dd(self):
+    self.flags, fmt, fnc = table_dd[self.fetch()]
+    return fmt.format(*[f(self) for f in fnc])
 
 
 table_cb = {}
@@ -288,14 +265,11 @@ for i, op in {0x00:'RLC', 0x08:'RRC', 0x10:'RL', 0x18:'RR', 0x20:'SLA', 0x28:'SR
 for i, op, b, in [(i | b << 3, op, b) for i, op in {0x40:'BIT', 0x80:'RES', 0xc0:'SET'}.items() for b in range(8)]:
     for j, r in enumerate(('B', 'C', 'D', 'E', 'H', 'L', '(HL)', 'A')):
         table_cb[i | j] = (f'{op} {b},{r}', '', f'{op}\t{b},{r}')
+table_cb = compile_table(table_cb)
 
 
-def op_cb():
-    global table_cb
-    opcode = fetch()
-    if opcode not in table_cb:
-        return ''
-    return table_cb[opcode][2].lower()
+def op_cb(self):
+    return table_cb[self.fetch()][1]
 
 
 table = {
@@ -328,7 +302,7 @@ table = {
     0xc6: ('ADD A,n',    '',   'ADD\tA,%s',   byte),
     0xc9: ('RET',        'A',  'RET'),
     0xcb: ('',           '',   '%s',          op_cb),
-    0xcd: ('CALL nn',    'B',  'CALL\t%s',    word),
+    0xcd: ('CALL nn',    'BC', 'CALL\t%s',    word),
     0xce: ('ADC A,n',    '',   'ADC\tA,%s',   byte),
     0xd3: ('OUT n,A',    'B',  'OUT\t%s,A',   byte),
     0xd6: ('SUB n',      '',   'SUB\t%s',     byte),
@@ -373,174 +347,349 @@ for i, (r, s) in enumerate([(r, s) for r in ('B', 'C', 'D', 'E', 'H', 'L', '(HL)
 for i, cc in enumerate(('NZ', 'Z', 'NC', 'C', 'PO', 'PE', 'P', 'M')):
     table[0xc0 | i << 3] = (f'RET {cc}', '', f'RET\t{cc}')
     table[0xc2 | i << 3] = (f'JP {cc},nn', 'B', f'JP\t{cc},%s', word)
-    table[0xc4 | i << 3] = (f'CALL {cc},nn', 'B', f'CALL\t{cc},%s', word)
+    table[0xc4 | i << 3] = (f'CALL {cc},nn', 'BC', f'CALL\t{cc},%s', word)
 for i, qq in enumerate(('BC', 'DE', 'HL', 'AF')):
     table[0xc1 | i << 4] = (f'POP {qq}', '', f'POP\t{qq}')
     table[0xc5 | i << 4] = (f'PUSH {qq}', '', f'PUSH\t{qq}')
 for p in range(0, 0x40, 8):
     table[0xc7 | p] = (f'RST {p:02x}h', '', f'RST\t{p:02x}h')
-
-
-def op():
-    global flags, table
-    opcode = fetch()
-    if opcode not in table:
-        flags = ''
-        return ''
-    t = table[opcode]
-    flags = t[1]
-    return functools.reduce(lambda a, b : a.replace('%s', b(), 1), t[3:], t[2].lower())
-
-
-# main
-opts, args = getopt.getopt(sys.argv[1:], "e:flo:s:t:")
-if len(args) == 0:
-    print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
-    print(f'オプション:')
-    print(f'  -e <アドレス>   エントリ番地を指定する')
-    print(f'  -f              強制的に逆アセンブルする')
-    print(f'  -l              アドレスとデータを出力する')
-    print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
-    print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
-    print(f'  -t <ファイル名> ラベルテーブルを使用する')
-    sys.exit(0)
-remark = {}
-attrib = bytearray(len(buffer))
-start = 0
-listing = False
-force = False
-noentry = True
-file = sys.stdout
-tablefile = None
-for o, a in opts:
-    if o == '-e':
-        jumplabel[int(a, 0)] = True
-        noentry = False
-    elif o == '-f':
-        force = True
-    elif o == '-l':
-        listing = True
-    elif o == '-o':
-        file = open(a, 'w', encoding='utf-8')
-    elif o == '-s':
-        start = int(a, 0)
-    elif o == '-t':
-        tablefile = open(a, 'r', encoding='utf-8')
-with open(args[0], 'rb') as f:
-    data = f.read()[:len(buffer) - start]; end = start + len(data)
-    buffer[start:end] = data
-if tablefile:
-    for line in tablefile:
-        words = line.split(' ')
-        if words[0] == 'b':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'B' * size
-        elif words[0] == 'c':
-            jumplabel[int(words[1], 16)] = True
+table = compile_table(table)
+
+
+def op(self):
+    self.flags, fmt, fnc = table[self.fetch()]
+    return fmt.format(*[f(self) for f in fnc])
+
+
+class Z80Disassembler:
+    align = 1
+
+    def __init__(self, image, start=0, entries=(), labels=(), force=False):
+        self.buffer = bytearray(0x10000)
+        self.jumplabel = [False] * len(self.buffer)
+        self.label = [False] * len(self.buffer)
+        self.remark = {}
+        self.attrib = bytearray(len(self.buffer))
+        self.length = bytearray(len(self.buffer))
+        self.decoded = [None] * len(self.buffer)
+        self.pending = []
+        self.location = 0
+        self.flags = ''
+        self.origin = None
+        self.xref = array.array('i')
+        self.force = force
+        data = image[:len(self.buffer) - start]
+        self.start = start; self.end = start + len(data)
+        self.buffer[self.start:self.end] = data
+        noentry = True
+        for ea in entries:
+            self.jumplabel[ea] = True
             noentry = False
-        elif words[0] == 'd':
-            label[int(words[1], 16)] = True
-        elif words[0] == 'r':
-            addr = int(words[1], 16)
-            if addr not in remark:
-                remark[addr] = []
-            remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
-        elif words[0] == 's':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            attrib[base:base + size] = b'S' * size
-        elif words[0] == 't':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                jumplabel[buffer[i] | buffer[i + 1] << 8] = True
+        if self.parse(labels):
             noentry = False
-        elif words[0] == 'u':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 2, 2):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] | buffer[i + 1] << 8] = True
-        elif words[0] == 'v':
-            base = int(words[1], 16)
-            size = int(words[2], 10) if len(words) > 2 else 1
-            for i in range(base, base + size * 3, 3):
-                attrib[i:i + 2] = b'PP'
-                label[buffer[i] | buffer[i + 1] << 8] = True
-
-# path 1
-if noentry:
-    jumplabel[start] = True
-while (location := next((start + i for i, (a, l) in enumerate(zip(attrib[start:end], jumplabel[start:end])) if not a and l), end)) != end:
-    while True:
-        base = location
-        op()
-        attrib[base:location] = b'C' * (location - base)
-        if not force and 'A' in flags or location >= end or attrib[location]:
-            break
-
-# path 2
-if listing:
-    print(f'\t\t\t;-----------------------------------------------', file=file)
-    print(f'\t\t\t;\tZ80 disassembler', file=file)
-    print(f'\t\t\t;\tfilename: {args[0]}', file=file)
-    print(f'\t\t\t;-----------------------------------------------', file=file)
-    print(f'\t\t\t\torg\t{start:0{4 + (start >= 0xa000)}x}h', file=file)
-    print(f'\t\t\t', file=file)
-else:
-    print(f';-----------------------------------------------', file=file)
-    print(f';\tZ80 disassembler', file=file)
-    print(f';\tfilename: {args[0]}', file=file)
-    print(f';-----------------------------------------------', file=file)
-    print(f'\torg\t{start:0{4 + (start >= 0xa000)}x}h', file=file)
-    print(f'', file=file)
-location = start
-while location < end:
-    base = location
-    if base in remark:
-        for s in remark[base]:
-            if listing:
-                print(f'{base:04X}\t\t\t', end='', file=file)
-            print(f';{s}', file=file)
-    if attrib[base] == b'C'[0]:
-        s = op(); size = location - base
-        if listing:
-            print(f'{base:04X} ' + ''.join([f' {c:02X}' for c in buffer[base:location]]) + '\t' * (26 - size * 3 >> 3), end='', file=file)
-        if jumplabel[base]:
-            print(f'L{base:04x}:', end='', file=file)
-        print(f'\t{s}' if s else '\tdb\t' + ','.join([f'{c:0{2 + (c >= 0xa0)}x}h' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'S'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}:', end='', file=file)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:end], label[base + 1:end])) if a != b'S'[0] or l), end)
-        print(f'\tdb\t\'{buffer[base:location].decode()}\'', file=file)
-    elif attrib[base] == b'B'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}:', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 1 + i for i, (a, l) in enumerate(zip(attrib[base + 1:limit], label[base + 1:limit])) if a != b'B'[0] or l), limit)
-        print(f'\tdb\t' + ','.join([f'{c:0{2 + (c >= 0xa0)}x}h' for c in buffer[base:location]]), file=file)
-    elif attrib[base] == b'P'[0]:
-        if listing:
-            print(f'{base:04X}\t\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}:', end='', file=file)
-        limit = min(base + 8, end)
-        location = next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(attrib[base + 2:limit:2], label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
-        print(f'\tdw\t' + ','.join([f'L{buffer[i + 1]:02x}{buffer[i]:02x}' for i in range(base, location, 2)]), file=file)
-    else:
-        c = fetch()
+        if noentry:
+            self.jumplabel[start] = True
+        self.trace()
+
+    def parse(self, labels):
+        entry = False
+        for line in labels:
+            words = line.split(' ')
+            if words[0] == 'b':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'B' * size
+            elif words[0] == 'c':
+                self.jumplabel[int(words[1], 16)] = True
+                entry = True
+            elif words[0] == 'd':
+                self.label[int(words[1], 16)] = True
+            elif words[0] == 'g':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'G' * size
+            elif words[0] == 'r':
+                addr = int(words[1], 16)
+                if addr not in self.remark:
+                    self.remark[addr] = []
+                self.remark[addr] += [line[len(words[0] + words[1]) + 2:].rstrip()]
+            elif words[0] == 's':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                self.attrib[base:base + size] = b'S' * size
+            elif words[0] == 't':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.jumplabel[ea] = True
+                    self.refer(ea, 'P', i)
+                entry = True
+            elif words[0] == 'u':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 2, 2):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+            elif words[0] == 'v':
+                base = int(words[1], 16)
+                size = int(words[2], 10) if len(words) > 2 else 1
+                for i in range(base, base + size * 3, 3):
+                    self.attrib[i:i + 2] = b'PP'
+                    ea = self.buffer[i] | self.buffer[i + 1] << 8
+                    self.label[ea] = True
+                    self.refer(ea, 'P', i)
+        return entry
+
+    def fetch(self):
+        c = self.buffer[self.location]
+        self.location += 1
+        return c
+
+    def jump(self, ea):
+        if not self.jumplabel[ea]:
+            self.jumplabel[ea] = True
+            heapq.heappush(self.pending, ea)
+
+    def refer(self, ea, kind=None, origin=None):
+        if origin is None:
+            origin = self.origin
+        if origin is not None:
+            self.xref.extend((ea, origin, ord(kind or ('C' if 'C' in self.flags else 'J' if 'B' in self.flags else 'R'))))
+
+    def trace(self):
+        self.pending = [i for i in range(self.start, self.end) if self.jumplabel[i]]
+        while self.pending:
+            self.location = heapq.heappop(self.pending)
+            if self.location < self.start or self.location >= self.end or self.attrib[self.location]:
+                continue
+            while True:
+                base = self.origin = self.location
+                self.decoded[base] = op(self)
+                self.length[base] = self.location - base
+                self.attrib[base:self.location] = b'C' * (self.location - base)
+                if not self.force and 'A' in self.flags or self.location >= self.end or self.attrib[self.location]:
+                    break
+        self.origin = None
+
+    def decode(self, addr):
+        self.location = addr
+        return op(self)
+
+    def split(self, count):
+        cuts = [self.start]; decodes = []
+        self.location = self.start
+        while self.location < self.end:
+            base = self.location
+            if base >= self.start + (self.end - self.start) * len(cuts) // count:
+                cuts += [base]
+            if self.attrib[base] != b'C'[0]:
+                self.location = self.extent(base)
+            elif self.length[base]:
+                self.location = base + self.length[base]
+            else:
+                decodes += [base]
+                op(self)
+        return cuts + [self.end], decodes
+
+    def extent(self, base):
+        if self.attrib[base] == b'S'[0]:
+            return dasm.stretch(self.attrib, self.label, base + 1, self.end, b'S'[0])
+        if self.attrib[base] == b'B'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 1 + i for i, (a, l) in enumerate(zip(self.attrib[base + 1:limit], self.label[base + 1:limit])) if a != b'B'[0] or l), limit)
+        if self.attrib[base] == b'P'[0]:
+            limit = min(base + 8, self.end)
+            return next((base + 2 + i * 2 for i, (a, l) in enumerate(zip(self.attrib[base + 2:limit:2], self.label[base + 2:limit:2])) if a != b'P'[0] or l), limit)
+        if self.attrib[base] == b'G'[0]:
+            return dasm.span(self.attrib, base + 1, self.end, b'G'[0])
+        return base + 1
+
+    def records(self, begin=None, stop=None):
+        self.location = self.start if begin is None else begin
+        stop = self.end if stop is None else stop
+        while self.location < stop:
+            base = self.location
+            if base in self.remark:
+                for s in self.remark[base]:
+                    yield base, b'', '', s, 'R'
+            if self.attrib[base] == b'C'[0]:
+                if self.length[base]:
+                    s = self.decoded[base]; self.location = base + self.length[base]
+                else:
+                    s = op(self)
+                data = bytes(self.buffer[base:self.location])
+                name = f'L{base:04x}' if self.jumplabel[base] else ''
+                yield base, data, name, s if s else 'db\t' + ','.join([f'{c:0{2 + (c >= 0xa0)}x}h' for c in data]), 'C'
+            elif self.attrib[base] == b'S'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, f'db\t\'{data.decode()}\'', 'S'
+            elif self.attrib[base] == b'B'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                data = bytes(self.buffer[base:self.location])
+                yield base, data, name, 'db\t' + ','.join([f'{c:0{2 + (c >= 0xa0)}x}h' for c in data]), 'B'
+            elif self.attrib[base] == b'P'[0]:
+                name = f'L{base:04x}' if self.label[base] else ''
+                self.location = self.extent(base)
+                yield base, bytes(self.buffer[base:self.location]), name, 'dw\t' + ','.join([f'L{self.buffer[i + 1]:02x}{self.buffer[i]:02x}' for i in range(base, self.location, 2)]), 'P'
+            elif self.attrib[base] == b'G'[0]:
+                self.location = self.extent(base)
+                if self.location < self.end:
+                    yield self.location, b'', '', f'org\t{self.location:0{4 + (self.location >= 0xa000)}x}h', 'G'
+            else:
+                c = self.fetch()
+                name = f'L{base:04x}' if self.label[base] else ''
+                yield base, bytes([c]), name, f'db\t{c:0{2 + (c >= 0xa0)}x}h' + (f'\t;\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), ''
+
+    def lines(self, filename, listing=False):
+        yield from self.header(filename, listing)
+        yield from self.body(listing)
+        yield from self.footer(listing)
+
+    def header(self, filename, listing=False):
         if listing:
-            print(f'{base:04X}  {c:02X}\t\t', end='', file=file)
-        if label[base]:
-            print(f'L{base:04x}:', end='', file=file)
-        print(f'\tdb\t{c:0{2 + (c >= 0xa0)}x}h' + (f'\t;\'{c:c}\'' if c >= 0x20 and c < 0x7f else ''), file=file)
-if listing:
-    print(f'{location & 0xffff:04X}\t\t\t', end='', file=file)
-print('\tend', file=file)
+            yield f'\t\t\t;-----------------------------------------------\n'
+            yield f'\t\t\t;\tZ80 disassembler\n'
+            yield f'\t\t\t;\tfilename: {filename}\n'
+            yield f'\t\t\t;-----------------------------------------------\n'
+            yield f'\t\t\t\torg\t{self.start:0{4 + (self.start >= 0xa000)}x}h\n'
+            yield f'\t\t\t\n'
+        else:
+            yield f';-----------------------------------------------\n'
+            yield f';\tZ80 disassembler\n'
+            yield f';\tfilename: {filename}\n'
+            yield f';-----------------------------------------------\n'
+            yield f'\torg\t{self.start:0{4 + (self.start >= 0xa000)}x}h\n'
+            yield f'\n'
+
+    def body(self, listing=False, begin=None, stop=None):
+        for base, data, name, s, kind in self.records(begin, stop):
+            if not listing:
+                prefix = ''
+            elif kind == 'C':
+                prefix = f'{base:04X} ' + ''.join([f' {c:02X}' for c in data]) + '\t' * (26 - len(data) * 3 >> 3)
+            elif kind:
+                prefix = f'{base:04X}\t\t\t'
+            else:
+                prefix = f'{base:04X}  {data[0]:02X}\t\t'
+            if kind == 'R':
+                yield f'{prefix};{s}\n'
+            elif name:
+                yield f'{prefix}{name}:\t{s}\n'
+            else:
+                yield f'{prefix}\t{s}\n'
+
+    def footer(self, listing=False):
+        yield (f'{self.location & 0xffff:04X}\t\t\t' if listing else '') + '\tend\n'
+
+
+options = "b:c:d:e:fj:k:lo:rs:t:x:"
+
+
+def main(argv=None):
+    opts, args = getopt.getopt(sys.argv[1:] if argv is None else argv, options, ['watch'])
+    if len(args) == 0:
+        print(f'使い方: {os.path.basename(sys.argv[0])} [オプション] ファイル名')
+        print(f'オプション:')
+        print(f'  -b <バイト数>   出力バッファのサイズを指定する(デフォルト:1048576)')
+        print(f'  -c <フォルダ>   解析結果をキャッシュするフォルダを指定する')
+        print(f'  -d <ファイル名> 解析結果をバイナリ形式で書き出す(mmap可能)')
+        print(f'  -e [<バンク>:]<アドレス> エントリ番地を指定する')
+        print(f'  -f              強制的に逆アセンブルする')
+        print(f'  -j <プロセス数> 出力を並列に生成する(デフォルト:1)')
+        print(f'  -k <アドレス>:<バイト数>[:<位置>] バンク切り替えの窓の番地とサイズを指定する')
+        print(f'  -l              アドレスとデータを出力する')
+        print(f'  -o <ファイル名> 出力ファイルを指定する(デフォルト:標準出力)')
+        print(f'  -r              相互参照をコメントとして出力する')
+        print(f'  -s <アドレス>   開始番地を指定する(デフォルト:0)')
+        print(f'  -t <ファイル名> ラベルテーブルを使用する')
+        print(f'  -x <ファイル名> 相互参照の一覧を書き出す')
+        print(f'  --watch         入力ファイルとラベルテーブルの変更を監視して出力ファイルを更新する')
+        print(f'ファイル名:')
+        print(f'  <アーカイブ>.zip:<メンバー名> でzipアーカイブの中のファイルを直接読み込む')
+        print(f'  拡張子が.gz/.xzのファイルは展開しながら読み込む')
+        print(f'バンク(-k):')
+        print(f'  ファイルの<位置>(デフォルト:0)から-sの番地に置く固定領域を読み、残りを窓のサイズのバンクに分ける')
+        print(f'  固定領域は-sから窓の手前まで(窓が-sより下にあるときは$ffffまで)')
+        print(f'  -eとラベルテーブルの番地を<バンク>:<番地>と書くとそのバンクだけに適用する(バンクは10進数)')
+        sys.exit(0)
+    start = 0
+    listing = False
+    force = False
+    jobs = 1
+    entries = []
+    output = None
+    bufsize = 0x100000
+    cache = None
+    labels = ()
+    table = None
+    watch = False
+    comments = False
+    xrefs = None
+    mapfile = None
+    window = None
+    for o, a in opts:
+        if o == '-b':
+            bufsize = int(a, 0)
+        elif o == '-c':
+            cache = a
+        elif o == '-d':
+            mapfile = a
+        elif o == '-e':
+            entries += [dasm.address(a)]
+        elif o == '-f':
+            force = True
+        elif o == '-j':
+            jobs = int(a, 0)
+        elif o == '-k':
+            try:
+                window = [int(x, 0) for x in a.split(':')] + [0]
+            except ValueError:
+                window = []
+            if not 3 <= len(window) <= 4 or min(window) < 0 or window[1] == 0:
+                print(f'{os.path.basename(sys.argv[0])}: -k は<アドレス>:<バイト数>[:<位置>]で指定してください', file=sys.stderr)
+                sys.exit(2)
+        elif o == '-l':
+            listing = True
+        elif o == '-o':
+            output = a
+        elif o == '-r':
+            comments = True
+        elif o == '-s':
+            start = int(a, 0)
+        elif o == '-t':
+            table = a
+            with open(a, 'r', encoding='utf-8') as f:
+                labels = f.readlines()
+        elif o == '-x':
+            xrefs = a
+        elif o == '--watch':
+            watch = True
+    if not window and any(isinstance(ea, tuple) for ea in entries):
+        print(f'{os.path.basename(sys.argv[0])}: <バンク>:<アドレス> の指定には-kが必要です', file=sys.stderr)
+        sys.exit(2)
+    if not window and dasm.prefixed(labels):
+        print(f'{os.path.basename(sys.argv[0])}: {table}:{dasm.prefixed(labels)[0]}: <バンク>:<アドレス> の指定には-kが必要です', file=sys.stderr)
+        sys.exit(2)
+    if watch:
+        if window:
+            print(f'{os.path.basename(sys.argv[0])}: --watch は-kと同時に使えません', file=sys.stderr)
+            sys.exit(2)
+        dasm.watch(Z80Disassembler, args[0], table, output, start, entries, force, listing, jobs, bufsize, comments, xrefs, mapfile)
+        return
+    image = dasm.read(args[0])
+    with dasm.create(output, bufsize) as file:
+        if window:
+            file.writelines(dasm.banked(Z80Disassembler, args[0], image, start, *window[:3], entries, labels, force, listing, jobs, cache, comments, xrefs, mapfile))
+        else:
+            file.writelines(dasm.output(Z80Disassembler, args[0], image, start, entries, labels, force, listing, jobs, cache, comments, xrefs, mapfile))
+
+
+if __name__ == '__main__':
+    main()